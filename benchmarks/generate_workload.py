@@ -0,0 +1,244 @@
+"""
+Synthetic sacct workload generator.
+
+Writes pipe-delimited sacct logs (JobList_YYYY-MM.txt) with the field set
+described in the README, plus matching monthly capacity snapshots
+(capacities-YYYY_MM_DD.txt) in sinfo format. The generated workload includes:
+
+- GPU partitions (one GPU type each) and CPU-only partitions
+- multi-node jobs with compressed, zero-padded hostlists
+- pending jobs (Start/End 'Unknown', 'None assigned' nodelist)
+- running jobs with no End, both at the end of the period and in a month's
+  log for jobs that only finish in a later month
+- JobIDs duplicated across monthly logs, with the newest log holding the
+  final record
+
+Jobs are generated and written in chunks, so tens of millions of jobs can be
+produced with bounded memory.
+
+Usage:
+    python -m benchmarks.generate_workload --jobs 1000000 --output-dir /tmp/workload
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SINFO_HEADER = "NODELIST|PARTITION|CPUS|MEMORY|GRES"
+
+GPU_TYPE_NAMES = ["a100", "h100", "v100", "l40s", "a40", "mi250", "t4", "rtx6000"]
+
+CPUS_PER_NODE = 64
+MEM_MB_PER_NODE = 512000
+GPUS_PER_NODE = 4
+
+
+def make_cluster(n_partitions: int, n_gpu_types: int, nodes_per_partition: int) -> pd.DataFrame:
+    """
+    Return one row per partition with its node prefix and GPU type. Half of the
+    partitions (rounded up) are GPU partitions, cycling through n_gpu_types types.
+    """
+    n_gpu_partitions = (n_partitions + 1) // 2 if n_gpu_types else 0
+    rows = []
+    for p in range(n_partitions):
+        is_gpu = p < n_gpu_partitions
+        gpu_type = GPU_TYPE_NAMES[p % n_gpu_types] if is_gpu else None
+        rows.append({
+            "partition": f"{'gpu' if is_gpu else 'cpu'}{p:02d}",
+            "prefix": f"{'g' if is_gpu else 'c'}{p:02d}n",
+            "gpu_type": gpu_type,
+            "n_nodes": nodes_per_partition,
+        })
+    return pd.DataFrame(rows)
+
+
+def write_capacities(cluster: pd.DataFrame, dates, output_dir: Path) -> None:
+    """Write one sinfo-format capacity snapshot per date."""
+    lines = [SINFO_HEADER]
+    for part in cluster.itertuples():
+        gres = f"gpu:{part.gpu_type}:{GPUS_PER_NODE}(S:0-1)" if part.gpu_type else "(null)"
+        for i in range(1, part.n_nodes + 1):
+            lines.append(f"{part.prefix}{i:03d}|{part.partition}|{CPUS_PER_NODE}|{MEM_MB_PER_NODE}|{gres}")
+    content = "\n".join(lines) + "\n"
+
+    for date in dates:
+        (output_dir / f"capacities-{date:%Y_%m_%d}.txt").write_text(content)
+
+
+def _format_times(times: np.ndarray) -> np.ndarray:
+    """Format datetime64 values as sacct timestamps, with 'Unknown' for NaT."""
+    formatted = times.astype("datetime64[s]").astype(str).astype(object)
+    formatted[np.isnat(times)] = "Unknown"
+    return formatted
+
+
+def _hostlists(prefix: np.ndarray, first: np.ndarray, n_nodes: np.ndarray) -> pd.Series:
+    """Build compressed hostlists such as 'g00n003' or 'g00n[003-006]'."""
+    first_s = pd.Series(first).map("{:03d}".format)
+    last_s = pd.Series(first + n_nodes - 1).map("{:03d}".format)
+    prefix = pd.Series(prefix)
+    single = prefix + first_s
+    multi = prefix + "[" + first_s + "-" + last_s + "]"
+    return single.where(n_nodes == 1, multi)
+
+
+def generate_jobs(rng, n_jobs: int, first_jobid: int, cluster: pd.DataFrame, n_users: int,
+                  period_start: pd.Timestamp, period_end: pd.Timestamp) -> pd.DataFrame:
+    """Return n_jobs synthetic jobs with final (completed, running or pending) records."""
+    part_idx = rng.integers(0, len(cluster), n_jobs)
+    part_nodes = cluster["n_nodes"].to_numpy()[part_idx]
+    gpu_type = cluster["gpu_type"].to_numpy()[part_idx]
+    is_gpu = pd.notna(gpu_type)
+
+    n_nodes = np.minimum(rng.choice([1, 1, 1, 1, 1, 1, 2, 4, 8], n_jobs), part_nodes)
+    first_node = 1 + (rng.random(n_jobs) * (part_nodes - n_nodes + 1)).astype(np.int64)
+    cpus_per_node = rng.choice([1, 4, 8, 16, 32, CPUS_PER_NODE], n_jobs)
+    cpus_per_node = np.where(n_nodes > 1, CPUS_PER_NODE, cpus_per_node)
+    gpus_per_node = np.where(is_gpu, rng.integers(1, GPUS_PER_NODE + 1, n_jobs), 0)
+    mem_mb = cpus_per_node * rng.choice([1000, 2000, 4000, 8000], n_jobs)
+
+    span_s = int((period_end - period_start).total_seconds())
+    submit = period_start.to_datetime64() + rng.integers(0, span_s, n_jobs).astype("timedelta64[s]")
+    queue_s = rng.exponential(1800, n_jobs).astype(np.int64)
+    run_s = np.minimum(rng.exponential(4 * 3600, n_jobs), 14 * 86400).astype(np.int64) + 1
+    start = submit + queue_s.astype("timedelta64[s]")
+    end = start + run_s.astype("timedelta64[s]")
+
+    # jobs still pending or running when the logs were taken
+    pending = start >= period_end.to_datetime64()
+    running = ~pending & (end >= period_end.to_datetime64())
+    start = np.where(pending, np.datetime64("NaT"), start)
+    end = np.where(pending | running, np.datetime64("NaT"), end)
+    state = np.where(pending, "PENDING", np.where(running, "RUNNING", "COMPLETED"))
+    state = np.where(~pending & ~running & (rng.random(n_jobs) < 0.05), "FAILED", state)
+
+    node_s = pd.Series(n_nodes).astype(str)
+    cpu_s = pd.Series(cpus_per_node * n_nodes).astype(str)
+    gpu_s = pd.Series(gpus_per_node * n_nodes).astype(str)
+    mem_s = pd.Series(mem_mb * n_nodes).astype(str) + "M"
+    gres = ("gres/gpu:" + pd.Series(gpu_type, dtype=object).fillna("") + "=" + gpu_s
+            + ",gres/gpu=" + gpu_s + ",")
+    gres = gres.where(is_gpu, "")
+    req_gres = ("gres/gpu=" + gpu_s + ",").where(is_gpu, "")
+
+    alloc_tres = "billing=" + cpu_s + ",cpu=" + cpu_s + "," + gres + "mem=" + mem_s + ",node=" + node_s
+    req_tres = "billing=" + cpu_s + ",cpu=" + cpu_s + "," + req_gres + "mem=" + mem_s + ",node=" + node_s
+
+    started = np.where(pending, period_end.to_datetime64(), start)
+    running_s = (period_end.to_datetime64() - started) // np.timedelta64(1, "s")
+    elapsed = np.where(pending, 0, np.where(running, running_s, run_s))
+
+    return pd.DataFrame({
+        "JobID": np.arange(first_jobid, first_jobid + n_jobs),
+        "User": pd.Series(rng.integers(0, n_users, n_jobs)).map("user{:04d}".format),
+        "Partition": cluster["partition"].to_numpy()[part_idx],
+        "Submit": submit,
+        "Start": start,
+        "End": end,
+        "State": state,
+        "ElapsedRaw": elapsed,
+        "NodeList": _hostlists(cluster["prefix"].to_numpy()[part_idx], first_node, n_nodes)
+                        .where(~pending, "None assigned"),
+        "ReqTRES": req_tres,
+        "AllocTRES": alloc_tres.where(~pending, ""),
+    })
+
+
+def _to_sacct_rows(jobs: pd.DataFrame) -> pd.DataFrame:
+    return jobs.assign(
+        Submit=_format_times(jobs["Submit"].to_numpy()),
+        Start=_format_times(jobs["Start"].to_numpy()),
+        End=_format_times(jobs["End"].to_numpy()),
+    )
+
+
+def write_job_logs(jobs: pd.DataFrame, months: pd.DatetimeIndex, output_dir: Path, header: bool) -> None:
+    """
+    Append jobs to the monthly logs. A job is logged in the month it was
+    submitted and in every later month it was still running in. Every log
+    but the last one that holds it shows the job as RUNNING with no End.
+    """
+    month_start = months.to_numpy()
+    month_end = np.append(month_start[1:], (months[-1] + pd.offsets.MonthBegin()).to_datetime64())
+
+    submit = jobs["Submit"].to_numpy()
+    end = jobs["End"].to_numpy()
+    finish = np.where(np.isnat(end), month_end[-1], end)
+
+    for m, (m_start, m_end) in enumerate(zip(month_start, month_end)):
+        in_month = (submit < m_end) & (finish >= m_start)
+        month_jobs = jobs[in_month]
+        if month_jobs.empty and not header:
+            continue
+
+        # jobs ending after this log was taken are still running in it
+        unfinished = (end[in_month] >= m_end) & (m < len(months) - 1)
+        month_jobs = month_jobs.assign(
+            End=month_jobs["End"].where(~unfinished, pd.NaT),
+            State=month_jobs["State"].where(~unfinished, "RUNNING"),
+        )
+
+        path = output_dir / f"JobList_{pd.Timestamp(m_start):%Y-%m}.txt"
+        _to_sacct_rows(month_jobs).to_csv(path, sep="|", index=False, header=header,
+                                          mode="w" if header else "a")
+
+
+def generate_workload(output_dir, n_jobs: int, start: str = "2025-01-01", months: int = 3,
+                      n_partitions: int = 8, n_gpu_types: int = 3, nodes_per_partition: int = 32,
+                      n_users: int = 500, chunk_jobs: int = 1_000_000, seed: int = 0) -> Path:
+    """Write a synthetic workload (sacct logs and capacity snapshots) to output_dir."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    period_start = pd.Timestamp(start)
+    month_starts = pd.date_range(period_start, periods=months, freq="MS")
+    period_end = month_starts[-1] + pd.offsets.MonthBegin()
+
+    cluster = make_cluster(n_partitions, n_gpu_types, nodes_per_partition)
+    write_capacities(cluster, month_starts, output_dir)
+
+    # write empty logs with headers, then append job chunks
+    empty = generate_jobs(rng, 0, 0, cluster, n_users, period_start, period_end)
+    write_job_logs(empty, month_starts, output_dir, header=True)
+
+    first_jobid = 1_000_000
+    for chunk_start in range(0, n_jobs, chunk_jobs):
+        n = min(chunk_jobs, n_jobs - chunk_start)
+        jobs = generate_jobs(rng, n, first_jobid + chunk_start, cluster, n_users, period_start, period_end)
+        write_job_logs(jobs, month_starts, output_dir, header=False)
+
+    return output_dir
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a synthetic sacct workload.")
+    parser.add_argument("--output-dir", required=True, help="Directory to write logs and capacities to")
+    parser.add_argument("--jobs", type=int, default=100_000, help="Number of distinct jobs")
+    parser.add_argument("--start", default="2025-01-01", help="First month (YYYY-MM-DD)")
+    parser.add_argument("--months", type=int, default=3, help="Number of monthly logs")
+    parser.add_argument("--partitions", type=int, default=8, help="Number of partitions")
+    parser.add_argument("--gpu-types", type=int, default=3, choices=range(0, len(GPU_TYPE_NAMES) + 1),
+                        help="Number of GPU types")
+    parser.add_argument("--nodes-per-partition", type=int, default=32, help="Nodes in each partition")
+    parser.add_argument("--users", type=int, default=500, help="Number of users")
+    parser.add_argument("--chunk-jobs", type=int, default=1_000_000, help="Jobs generated per chunk")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output_dir = generate_workload(
+        args.output_dir, args.jobs, start=args.start, months=args.months,
+        n_partitions=args.partitions, n_gpu_types=args.gpu_types,
+        nodes_per_partition=args.nodes_per_partition, n_users=args.users,
+        chunk_jobs=args.chunk_jobs, seed=args.seed,
+    )
+    print(f"Wrote {args.jobs} jobs over {args.months} months to {output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Stage benchmarks for the reporting pipeline.
+
+For each requested scale (number of jobs) a synthetic workload is generated
+with benchmarks.generate_workload and every pipeline stage is timed in a
+fresh process:
+
+- capacity_history: get_capacity_history
+- capacity_store_build, capacity_store_warm: update_capacity_store into an
+  empty store, then again with nothing new to ingest
+- capacity_expand: expand_capacity_snapshots over the report window
+- ingest: get_sacct_data (reading, preprocessing and GPU attribution)
+- timeseries: make_sacct_timeseries_fast (hourly)
+- capacity_timeseries, utilisation_ratios: hourly partition capacity from the
+  snapshot intervals, joined with the time series by make_utilisation_ratios
+- timeseries_reference: make_sacct_timeseries, only up to --reference-max-jobs
+
+Each stage records its wall time, its peak RSS and the number of output
+rows. The RSS high-water mark is reset before every stage on Linux, so the
+peak is that of the stage itself (peak_rss_scope "stage"); elsewhere it is
+the process peak so far ("process"). The ingest stage also records the in-memory size
+of the job table (table_mb, from DataFrame.memory_usage(deep=True)). Results are written as JSON so that runs can be
+compared across versions with --compare.
+
+Usage:
+    python -m benchmarks.run_benchmarks --scales 10000 100000 1000000 --output bench.json
+    python -m benchmarks.run_benchmarks --scales 10000 100000 --compare bench.json
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.generate_workload import generate_workload
+
+
+_PROC_STATUS = Path("/proc/self/status")
+_PROC_CLEAR_REFS = Path("/proc/self/clear_refs")
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the process RSS high-water mark (Linux only); return whether it worked."""
+    try:
+        _PROC_CLEAR_REFS.write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb(since_reset: bool = False) -> float:
+    """Return the peak RSS in MB, since the last reset when since_reset is set."""
+    if since_reset:
+        for line in _PROC_STATUS.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _timed(stages: dict, name: str, func, *args, **kwargs):
+    reset = _reset_peak_rss()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    stages[name] = {
+        "seconds": round(time.perf_counter() - start, 4),
+        "peak_rss_mb": round(_peak_rss_mb(reset), 1),
+        "peak_rss_scope": "stage" if reset else "process",
+        "rows_out": len(result),
+    }
+    return result
+
+
+def run_scale(workload_dir: str, report_start: str, report_end: str, reference: bool) -> dict:
+    """Run every pipeline stage on one workload and return the stage measurements."""
+    # imported here so that the measurement process loads the code under test itself
+    from src.capacities import capacity_timeseries, expand_capacity_snapshots, get_capacity_history
+    from src.capacity_store import update_capacity_store
+    from src.capacity_helpers import get_gpu_types
+    from src.jobs import get_sacct_data
+    from src.timeseries import make_sacct_timeseries, make_sacct_timeseries_fast, make_utilisation_ratios
+
+    start, end = pd.Timestamp(report_start), pd.Timestamp(report_end)
+    stages = {"startup": {"seconds": 0.0, "peak_rss_mb": round(_peak_rss_mb(), 1),
+                          "peak_rss_scope": "process", "rows_out": 0}}
+
+    history = _timed(stages, "capacity_history", get_capacity_history, workload_dir)
+    with tempfile.TemporaryDirectory() as store_dir:
+        _timed(stages, "capacity_store_build", update_capacity_store, store_dir, workload_dir)
+        _timed(stages, "capacity_store_warm", update_capacity_store, store_dir, workload_dir)
+    _timed(stages, "capacity_expand", expand_capacity_snapshots, history, start, end)
+    jobs = _timed(stages, "ingest", get_sacct_data, workload_dir, history)
+    stages["ingest"]["table_mb"] = round(jobs.memory_usage(deep=True).sum() / 1000**2, 1)
+
+    res_list = ["cpu", "mem_gb"] + get_gpu_types(history) + ["indeterminate_gpu"]
+    util = _timed(stages, "timeseries", make_sacct_timeseries_fast, jobs, res_list, start, end, "h")
+    ratio_res_list = ["cpu", "mem_gb"] + get_gpu_types(history)
+    capacity = _timed(stages, "capacity_timeseries", capacity_timeseries, history, ratio_res_list, start, end, "h")
+    _timed(stages, "utilisation_ratios", make_utilisation_ratios, util, capacity, ratio_res_list)
+    if reference:
+        _timed(stages, "timeseries_reference", make_sacct_timeseries, jobs, res_list, start, end, "h")
+
+    return stages
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_comparison(results: list[dict], baseline_path: str) -> None:
+    """Print the time ratio of each stage against a previous results file."""
+    baseline = json.loads(Path(baseline_path).read_text())
+    previous = {r["jobs"]: r["stages"] for r in baseline["results"]}
+
+    print(f"\nComparison with {baseline_path} (time ratio, <1 is faster)")
+    for result in results:
+        old_stages = previous.get(result["jobs"])
+        if old_stages is None:
+            continue
+        for stage, new in result["stages"].items():
+            old = old_stages.get(stage)
+            if not old or not old["seconds"]:
+                continue
+            ratio = new["seconds"] / old["seconds"]
+            print(f"  {result['jobs']:>10} {stage:<22} {old['seconds']:>9.3f}s -> "
+                  f"{new['seconds']:>9.3f}s  x{ratio:.2f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the reporting pipeline stages.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="Numbers of jobs to benchmark")
+    parser.add_argument("--months", type=int, default=3, help="Months of logs per workload")
+    parser.add_argument("--partitions", type=int, default=8, help="Number of partitions")
+    parser.add_argument("--gpu-types", type=int, default=3, help="Number of GPU types")
+    parser.add_argument("--nodes-per-partition", type=int, default=32, help="Nodes in each partition")
+    parser.add_argument("--workload-dir", help="Keep generated workloads here instead of a temporary directory")
+    parser.add_argument("--reference-max-jobs", type=int, default=20_000,
+                        help="Also time make_sacct_timeseries up to this many jobs")
+    parser.add_argument("--output", default="benchmark_results.json", help="Path of the JSON results")
+    parser.add_argument("--compare", help="Previous JSON results to compare against")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    report_start = pd.Timestamp("2025-01-01")
+    report_end = report_start + pd.DateOffset(months=args.months)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base_dir = Path(args.workload_dir or tmp)
+        results = []
+
+        for n_jobs in args.scales:
+            workload_dir = base_dir / f"jobs_{n_jobs}"
+            if not workload_dir.exists():
+                generate_workload(workload_dir, n_jobs, start=str(report_start.date()), months=args.months,
+                                  n_partitions=args.partitions, n_gpu_types=args.gpu_types,
+                                  nodes_per_partition=args.nodes_per_partition)
+
+            # a fresh process per scale keeps peak RSS measurements independent
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                stages = pool.submit(run_scale, str(workload_dir), str(report_start.date()),
+                                     str(report_end.date()), n_jobs <= args.reference_max_jobs).result()
+
+            results.append({"jobs": n_jobs, "stages": stages})
+            summary = ", ".join(f"{name} {s['seconds']:.2f}s" for name, s in stages.items() if name != "startup")
+            peak = max(s["peak_rss_mb"] for s in stages.values())
+            print(f"{n_jobs:>10} jobs: {summary} (peak RSS {peak:.0f} MB)")
+
+    output = {
+        "metadata": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "months": args.months,
+            "partitions": args.partitions,
+            "gpu_types": args.gpu_types,
+            "nodes_per_partition": args.nodes_per_partition,
+        },
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(output, indent=2))
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        _print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
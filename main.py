@@ -2,11 +2,55 @@ import argparse
 import datetime
 import os
 import sys
+from pathlib import Path
 
 import pandas as pd
-from src.capacities import get_capacities, get_capacity_history, expand_capacity_snapshots
-from src.timeseries import make_sacct_timeseries
-from src.jobs import get_sacct_data
+from src.cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_CACHE_BYTES
+from src.capacity_helpers import get_gpu_types
+from src.capacities import (
+    DEFAULT_SINFO_MAX_AGE,
+    capacity_timeseries,
+    expand_capacity_intervals,
+    expand_capacity_snapshots,
+    get_capacities,
+    get_capacity_history,
+)
+from src.capacity_store import capacity_store_dir, update_capacity_store
+from src.timeseries import (
+    AGGREGATE_FREQS,
+    make_sacct_timeseries_fast,
+    make_sacct_timeseries_grouped,
+    make_sacct_usage,
+    make_utilisation_ratios,
+)
+from src.incremental import (
+    append_job_report,
+    append_utilisation_report,
+    check_checkpoint,
+    check_report_columns,
+    ingested_signatures,
+    load_checkpoint,
+    new_sacct_files,
+    report_partition_order,
+    segment_jobs,
+    write_checkpoint,
+)
+from src.jobs import (
+    JOB_REPORT_COLUMNS,
+    chunk_rows_for_memory,
+    get_sacct_data,
+    list_sacct_files,
+    window_sacct_files,
+)
+from src.output import OUTPUT_FORMATS, to_long_layout, write_report
+from src.profiling import Profiler, count_data_lines
+from src.sacct import SACCT_WINDOWS, fetch_sacct_data
+
+# Stages instrumented by --profile, in execution order
+STAGES = ["capacity_history", "capacity_expand", "write_capacity_report", "sinfo",
+          "ingest", "write_job_report", "timeseries", "write_utilisation_report",
+          "utilisation_ratios", "write_ratio_report", "usage", "write_usage_report",
+          "grouped_timeseries", "write_grouped_report", "checkpoint"]
 
 def valid_date(s):
     try:
@@ -21,13 +65,65 @@ def parse_args():
     jobs_input_group = parser.add_mutually_exclusive_group(required=True)
     jobs_input_group.add_argument("--jobs-file", help="Single sacct log file")
     jobs_input_group.add_argument("--jobs-dir", help="Directory containing JobList_*.txt files")
+    jobs_input_group.add_argument("--from-sacct", action="store_true",
+                                  help="Query sacct for the report window instead of reading logs")
+    parser.add_argument("--sacct-path", default="sacct",
+                        help="sacct executable used by --from-sacct (default: sacct)")
+    parser.add_argument("--sacct-window", choices=list(SACCT_WINDOWS), default="month",
+                        help="Length of the windows --from-sacct queries separately (default: month)")
+    parser.add_argument("--sacct-concurrency", type=int, default=4,
+                        help="Maximum number of sacct queries run at once by --from-sacct (default: 4)")
+    parser.add_argument("--sacct-save-dir",
+                        help="Also save the output of each --from-sacct query as a JobList_*.txt log here")
 
     parser.add_argument("--capacities-dir", help="Path to capacity files")
+    parser.add_argument("--capacity-intervals", action="store_true",
+                        help="Write CapacityReport.csv as validity intervals instead of daily rows")
+    parser.add_argument("--sinfo-max-age", type=float, default=DEFAULT_SINFO_MAX_AGE / 3600,
+                        help="Reuse cached sinfo output younger than this many hours; 0 always runs sinfo (default: 1)")
+    parser.add_argument("--offline", action="store_true",
+                        help="Never run sinfo; use cached sinfo output or the latest stored capacity snapshot")
     parser.add_argument("--output-dir", default=".", help="Path to write output files")
     parser.add_argument("--report-start", type=valid_date, required=True,
                         help="Report start date (YYYY-MM-DD)")
     parser.add_argument("--report-end", type=valid_date, required=True,
                         help="Report end date (YYYY-MM-DD)")
+    parser.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR),
+                        help="Directory for cached preprocessed sacct logs")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Preprocess every sacct log without reading or writing the cache")
+    parser.add_argument("--cache-max-gb", type=float, default=DEFAULT_MAX_CACHE_BYTES / 1000**3,
+                        help="Maximum cache size in GB; oldest entries are evicted first")
+    parser.add_argument("--prune-to-window", action="store_true",
+                        help="Only ingest jobs that can be active in the report window, skipping older logs; "
+                             "JobReport.csv then lists only those jobs")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes used to parse sacct logs in --jobs-dir and build the time series")
+    stream_group = parser.add_mutually_exclusive_group()
+    stream_group.add_argument("--chunk-rows", type=int,
+                              help="Stream sacct logs in chunks of this many rows")
+    stream_group.add_argument("--max-memory", type=float,
+                              help="Stream sacct logs in chunks sized to stay within this many GB")
+    parser.add_argument("--freq", default="h",
+                        help="Snapshot frequency of UtilisationReport.csv as a pandas offset alias (default: h)")
+    parser.add_argument("--aggregate", nargs="+", choices=list(AGGREGATE_FREQS),
+                        help="Also write exact resource-hours per partition for these periods")
+    parser.add_argument("--group-by", nargs="+", metavar="COLUMN",
+                        help="Also write a sparse utilisation time series split by these job columns")
+    parser.add_argument("--utilisation-ratios", action="store_true",
+                        help="Also write the utilisation of each partition as a ratio of its capacity over time")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="csv",
+                        help="Write reports as CSV, or as zstd-compressed Parquet/Feather partitioned by month")
+    parser.add_argument("--utilisation-layout", choices=["wide", "long"], default="wide",
+                        help="Write UtilisationReport with a column per resource (wide) or a row per resource (long)")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="Also write the checkpoint that lets a later --append run extend these reports")
+    parser.add_argument("--append", action="store_true",
+                        help="Extend the reports in --output-dir from their end to --report-end using only new logs")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write per-stage timings, memory and row counts to Profile.json")
+    parser.add_argument("--profile-stages", nargs="+", choices=STAGES + ["all"], default=[],
+                        help="Also dump cProfile statistics for these stages (implies --profile)")
     return parser.parse_args()
 
 def validate_paths(args):
@@ -36,10 +132,19 @@ def validate_paths(args):
         jobs_path = os.path.abspath(os.path.expanduser(args.jobs_file))
         if not os.path.isfile(jobs_path):
             sys.exit(f"Error: jobs file does not exist → {jobs_path}")
-    else:
+    elif args.jobs_dir:
         jobs_path = os.path.abspath(os.path.expanduser(args.jobs_dir))
         if not os.path.isdir(jobs_path):
             sys.exit(f"Error: jobs directory does not exist → {jobs_path}")
+    else:
+        jobs_path = None
+
+    # Directory for the logs saved by --from-sacct
+    sacct_save_dir = None
+    if args.sacct_save_dir:
+        sacct_save_dir = os.path.abspath(os.path.expanduser(args.sacct_save_dir))
+        if not os.path.isdir(sacct_save_dir):
+            sys.exit(f"Error: sacct save directory does not exist → {sacct_save_dir}")
 
     # Capacities directory
     capacities_dir = None
@@ -53,61 +158,253 @@ def validate_paths(args):
     if not os.path.isdir(output_dir):
         sys.exit(f"Error: output directory does not exist → {output_dir}")
 
-    return jobs_path, capacities_dir, output_dir
+    # Cache directory
+    cache_dir = None
+    if not args.no_cache:
+        cache_dir = os.path.abspath(os.path.expanduser(args.cache_dir))
+
+    return jobs_path, capacities_dir, output_dir, cache_dir, sacct_save_dir
 
 def main():
     args = parse_args()
 
-    jobs_path, capacities_dir, output_dir = validate_paths(args)
+    jobs_path, capacities_dir, output_dir, cache_dir, sacct_save_dir = validate_paths(args)
     
     report_start = args.report_start
     report_end = args.report_end
 
+    if args.workers < 1:
+        sys.exit("Error: --workers must be a positive integer.")
+
+    if args.sacct_concurrency < 1:
+        sys.exit("Error: --sacct-concurrency must be a positive integer.")
+
+    if args.chunk_rows is not None and args.chunk_rows < 1:
+        sys.exit("Error: --chunk-rows must be a positive integer.")
+
+    if args.sinfo_max_age < 0:
+        sys.exit("Error: --sinfo-max-age cannot be negative.")
+
+    if args.offline and not cache_dir:
+        sys.exit("Error: --offline reads capacities from the cache and cannot be combined with --no-cache.")
+
     if report_start > report_end:
         sys.exit("Error: Report start date must be before or equal to report end date.")
 
-    print(f"Jobs input: {jobs_path}")
+    try:
+        pd.tseries.frequencies.to_offset(args.freq)
+    except ValueError:
+        sys.exit(f"Error: --freq is not a valid pandas frequency: '{args.freq}'.")
+
+    if args.checkpoint:
+        if args.from_sacct:
+            sys.exit("Error: --checkpoint records JobList logs and cannot be combined with --from-sacct.")
+        if args.output_format != "csv" or args.utilisation_layout != "wide":
+            sys.exit("Error: --checkpoint is only written for wide CSV reports.")
+
+    checkpoint, carried = None, None
+    if args.append:
+        if args.from_sacct:
+            sys.exit("Error: --append reads new JobList logs and cannot be combined with --from-sacct.")
+        if args.aggregate or args.group_by or args.utilisation_ratios:
+            sys.exit("Error: --aggregate, --group-by and --utilisation-ratios cannot be combined with --append.")
+        if args.output_format != "csv" or args.utilisation_layout != "wide":
+            sys.exit("Error: --append extends wide CSV reports only.")
+        checkpoint_state = load_checkpoint(output_dir)
+        if checkpoint_state is None:
+            sys.exit(f"Error: --append needs the checkpoint of an earlier --checkpoint run in {output_dir}.")
+        checkpoint, carried = checkpoint_state
+
+    print(f"Jobs input: {jobs_path or f'sacct ({args.sacct_path}, per {args.sacct_window})'}")
     print(f"Capacities dir: {capacities_dir}")
     print(f"Output dir: {output_dir}")
+    print(f"Cache dir: {cache_dir}")
     print(f"Report range: {report_start.date()} → {report_end.date()}")
     
+    cprofile_stages = STAGES if "all" in args.profile_stages else args.profile_stages
+    profiler = Profiler(enabled=args.profile or bool(cprofile_stages),
+                        cprofile_stages=cprofile_stages, output_dir=output_dir)
+
+    # The capacity report always covers the whole window, including appended ones
+    window_start = pd.Timestamp(checkpoint["report_start"]) if checkpoint else report_start
+
+    # Capacity snapshots and sinfo output are kept in a store in the cache directory
+    capacity_store = capacity_store_dir(cache_dir) if cache_dir else None
+
+    capacity_history_df = pd.DataFrame()
     if capacities_dir:
         # --- Capacities ---
-        capacity_history_df = get_capacity_history(capacities_dir)
+        with profiler.stage("capacity_history") as stage:
+            if capacity_store:
+                # only snapshot files added since the last run are parsed
+                capacity_history_df = stage.output(update_capacity_store(capacity_store, capacities_dir))
+            else:
+                capacity_history_df = stage.output(get_capacity_history(capacities_dir))
 
-        # Expand into a daily time series
-        filled_df = expand_capacity_snapshots(capacity_history_df, start=report_start,end=report_end)
+        with profiler.stage("capacity_expand", rows_in=len(capacity_history_df)) as stage:
+            if args.capacity_intervals:
+                # One row per node/partition state with its validity interval
+                filled_df = expand_capacity_intervals(capacity_history_df, start=window_start, end=report_end)
+            else:
+                # Expand into a daily time series
+                filled_df = expand_capacity_snapshots(capacity_history_df, start=window_start,end=report_end)
+            stage.output(filled_df)
 
-        capacity_report_path = os.path.join(output_dir, "CapacityReport.csv")
-        filled_df.to_csv(capacity_report_path, index=False)
+        with profiler.stage("write_capacity_report", rows_in=len(filled_df)):
+            write_report(filled_df, output_dir, "CapacityReport", args.output_format,
+                         time_column="valid_from" if args.capacity_intervals else "date")
 
     # --- Jobs ---
     
-    # uses current capacity only for gpu assignment
-    current_caps = get_capacities()
-    sacct_data = get_sacct_data(jobs_path, current_caps)
+    # gpu assignment uses the capacity in effect at each job's start when a
+    # capacity history is available, and the current capacity otherwise
+    if capacity_history_df.empty:
+        with profiler.stage("sinfo") as stage:
+            try:
+                gpu_caps = stage.output(get_capacities(capacity_store, max_age=args.sinfo_max_age * 3600,
+                                                       offline=args.offline))
+            except RuntimeError as e:
+                sys.exit(f"Error: {e}")
+    else:
+        gpu_caps = capacity_history_df
+    gpu_list = get_gpu_types(gpu_caps) + ["indeterminate_gpu"]
+    ts_res_list = ["cpu", "mem_gb"] + gpu_list
+    cols_to_keep = JOB_REPORT_COLUMNS + gpu_list
+    jobs_report_path = os.path.join(output_dir, "JobReport.csv")
+    util_report_path = os.path.join(output_dir, "UtilisationReport.csv")
+
+    if args.from_sacct:
+        log_files = []
+    elif os.path.isdir(jobs_path):
+        log_files = list_sacct_files(jobs_path)
+    else:
+        log_files = [Path(jobs_path)]
+    if checkpoint:
+        # only the logs that the existing reports have not seen are read
+        try:
+            check_checkpoint(checkpoint, carried, report_start, args.freq, ts_res_list)
+            check_report_columns(jobs_report_path, cols_to_keep,
+                                 util_report_path, ["snapshot time", "partition"] + ts_res_list)
+            log_files = new_sacct_files(log_files, checkpoint)
+        except ValueError as e:
+            sys.exit(f"Error: {e}")
+        if not log_files:
+            sys.exit("Error: no new sacct logs to append.")
+
+    chunk_rows = args.chunk_rows
+    if args.max_memory:
+        chunk_rows = chunk_rows_for_memory(int(args.max_memory * 1000**3))
+    # with --prune-to-window, skipped logs still count as ingested for --append
+    window = (window_start, report_end) if args.prune_to_window else None
+    read_files = window_sacct_files(log_files, window_start) if window else log_files
+    # counting log lines rereads the logs, so only do it when profiling
+    sacct_rows = sum(count_data_lines(f) for f in read_files) if profiler.enabled and read_files else None
+    with profiler.stage("ingest", rows_in=sacct_rows) as stage:
+        if args.from_sacct:
+            try:
+                sacct_data = fetch_sacct_data(report_start, report_end, gpu_caps, sacct_path=args.sacct_path,
+                                              window=args.sacct_window, concurrency=args.sacct_concurrency,
+                                              chunk_rows=chunk_rows, save_dir=sacct_save_dir)
+            except (OSError, RuntimeError, ValueError) as e:
+                sys.exit(f"Error: {e}")
+        else:
+            sacct_data = get_sacct_data(jobs_path, gpu_caps, cache_dir=cache_dir,
+                                        max_cache_bytes=int(args.cache_max_gb * 1000**3),
+                                        chunk_rows=chunk_rows, workers=args.workers, files=log_files,
+                                        window=window)
+        stage.output(sacct_data)
 
-    non_gpu_res_list = ['node', 'partition', 'cpu', 'mem_gb']
-    res_list = current_caps.columns.tolist()
-    gpu_list = [res for res in res_list if res not in non_gpu_res_list] + ["indeterminate_gpu"]
+    missing = [key for key in args.group_by or [] if key not in sacct_data.columns]
+    if missing:
+        sys.exit(f"Error: --group-by columns not in the job table: {', '.join(missing)}")
 
-    cols_to_keep = ["jobid", "user", "partition", "submit", "state", "elapsedraw",
-                    "queue_length_sec", "scheduling_coeff", "cpu", "mem_gb"] + gpu_list
     output_sacct_data = sacct_data[cols_to_keep].copy()
-    jobs_report_path = os.path.join(output_dir, "JobReport.csv")
-    output_sacct_data.to_csv(jobs_report_path, sep=",", index=False)
+    with profiler.stage("write_job_report", rows_in=len(output_sacct_data)):
+        if checkpoint:
+            superseded = append_job_report(jobs_report_path, output_sacct_data)
+            # jobs the checkpoint did not carry ended before the new window, so
+            # replacing them changes the earlier window in a full rebuild only
+            revised = set(superseded) - set(carried["jobid"])
+            if revised:
+                print(f"Warning: {len(revised)} jobs in the new logs replace jobs that ended before "
+                      f"{report_start.date()}; the earlier window keeps their old records.")
+        else:
+            write_report(output_sacct_data, output_dir, "JobReport", args.output_format, time_column="submit")
 
-    ts_res_list = ["cpu", "mem_gb"] + gpu_list
-    time_series_data = make_sacct_timeseries(
-        sacct_data,
-        ts_res_list,
-        report_start,
-        report_end,
-        freq="h"
-    )
-    util_report_path = os.path.join(output_dir, "UtilisationReport.csv")
-    time_series_data.to_csv(util_report_path, sep=",", index=False)
+    # an appended window also counts the earlier jobs still running at its start
+    ts_jobs = segment_jobs(sacct_data, carried, ts_res_list) if checkpoint else sacct_data
+    with profiler.stage("timeseries", rows_in=len(ts_jobs)) as stage:
+        time_series_data = make_sacct_timeseries_fast(
+            ts_jobs,
+            ts_res_list,
+            report_start,
+            report_end,
+            freq=args.freq,
+            workers=args.workers
+        )
+        stage.output(time_series_data)
+    with profiler.stage("write_utilisation_report", rows_in=len(time_series_data)):
+        if checkpoint:
+            full_grid = pd.date_range(start=window_start, end=report_end, freq=args.freq, inclusive="left")
+            append_utilisation_report(util_report_path, time_series_data,
+                                      report_partition_order(jobs_report_path), full_grid)
+        else:
+            util_report = time_series_data
+            if args.utilisation_layout == "long":
+                util_report = to_long_layout(time_series_data, ["snapshot time", "partition"])
+            write_report(util_report, output_dir, "UtilisationReport", args.output_format,
+                         time_column="snapshot time")
+
+    if args.utilisation_ratios:
+        # capacity comes from the history, or from the current sinfo output for the whole window
+        capacity_source = gpu_caps if "date" in gpu_caps.columns else gpu_caps.assign(date=report_start)
+        ratio_res_list = ["cpu", "mem_gb"] + get_gpu_types(capacity_source)
+        with profiler.stage("utilisation_ratios", rows_in=len(time_series_data)) as stage:
+            capacity_data = capacity_timeseries(capacity_source, ratio_res_list, report_start, report_end,
+                                                freq=args.freq)
+            ratio_data = stage.output(make_utilisation_ratios(time_series_data, capacity_data, ratio_res_list))
+        with profiler.stage("write_ratio_report", rows_in=len(ratio_data)):
+            write_report(ratio_data, output_dir, "UtilisationRatioReport", args.output_format,
+                         time_column="snapshot time")
+
+    if args.aggregate:
+        # Exact resource-hours per period, every period from one integration
+        freqs = [AGGREGATE_FREQS[name] for name in args.aggregate]
+        with profiler.stage("usage", rows_in=len(sacct_data)):
+            usage = make_sacct_usage(sacct_data, ts_res_list, report_start, report_end, freqs)
+        with profiler.stage("write_usage_report"):
+            for name, freq in zip(args.aggregate, freqs):
+                write_report(usage[freq], output_dir, f"UsageReport_{name}", args.output_format,
+                             time_column="period start")
+
+    if args.group_by:
+        with profiler.stage("grouped_timeseries", rows_in=len(sacct_data)) as stage:
+            grouped_data = stage.output(make_sacct_timeseries_grouped(
+                sacct_data, ts_res_list, report_start, report_end, freq=args.freq, by=args.group_by
+            ))
+        with profiler.stage("write_grouped_report", rows_in=len(grouped_data)):
+            write_report(grouped_data, output_dir, "GroupedUtilisationReport", args.output_format,
+                         time_column="snapshot time")
+
+    # an appended run always moves its checkpoint on to the new end
+    if args.checkpoint or checkpoint:
+        with profiler.stage("checkpoint", rows_in=len(ts_jobs)):
+            ingested = {**(checkpoint["files"] if checkpoint else {}), **ingested_signatures(log_files)}
+            write_checkpoint(output_dir, window_start, report_end, args.freq, ts_res_list, ingested, ts_jobs)
 
+    profile_path = profiler.write({
+        "jobs_input": jobs_path or "sacct",
+        "capacities_dir": capacities_dir,
+        "report_start": report_start.date(),
+        "report_end": report_end.date(),
+        "workers": args.workers,
+        "chunk_rows": chunk_rows,
+        "prune_to_window": args.prune_to_window,
+        "offline": args.offline,
+        "cache_dir": cache_dir,
+    })
+    if profile_path:
+        print(f"Profile: {profile_path}")
 
 if __name__ == "__main__":
     main()
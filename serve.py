@@ -0,0 +1,83 @@
+import argparse
+import os
+import stat
+import sys
+
+from src.cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_CACHE_BYTES
+from src.server import DEFAULT_RESULT_CACHE_ENTRIES, JobStore, ReportService, ResultCache, serve
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Serve utilisation, job and capacity queries from sacct logs kept in memory."
+    )
+    parser.add_argument("--jobs-dir", required=True, help="Directory containing JobList_*.txt files")
+    parser.add_argument("--capacities-dir", help="Path to capacity files")
+    listen_group = parser.add_mutually_exclusive_group()
+    listen_group.add_argument("--port", type=int, default=8765, help="Local HTTP port (default: 8765)")
+    listen_group.add_argument("--socket", help="Serve on this Unix socket instead of HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="HTTP address to bind (default: 127.0.0.1)")
+    parser.add_argument("--poll-seconds", type=float, default=60,
+                        help="Check for new sacct logs this often; 0 only refreshes on POST /refresh (default: 60)")
+    parser.add_argument("--result-cache-entries", type=int, default=DEFAULT_RESULT_CACHE_ENTRIES,
+                        help=f"Number of query results kept in memory (default: {DEFAULT_RESULT_CACHE_ENTRIES})")
+    parser.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR),
+                        help="Directory for cached preprocessed sacct logs")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Preprocess every sacct log without reading or writing the cache")
+    parser.add_argument("--cache-max-gb", type=float, default=DEFAULT_MAX_CACHE_BYTES / 1000**3,
+                        help="Maximum cache size in GB; oldest entries are evicted first")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes used to parse sacct logs")
+    parser.add_argument("--chunk-rows", type=int, help="Stream sacct logs in chunks of this many rows")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    jobs_dir = os.path.abspath(os.path.expanduser(args.jobs_dir))
+    if not os.path.isdir(jobs_dir):
+        sys.exit(f"Error: jobs directory does not exist → {jobs_dir}")
+
+    capacities_dir = None
+    if args.capacities_dir:
+        capacities_dir = os.path.abspath(os.path.expanduser(args.capacities_dir))
+        if not os.path.isdir(capacities_dir):
+            sys.exit(f"Error: capacity directory does not exist → {capacities_dir}")
+
+    cache_dir = None if args.no_cache else os.path.abspath(os.path.expanduser(args.cache_dir))
+
+    if args.workers < 1:
+        sys.exit("Error: --workers must be a positive integer.")
+    if args.chunk_rows is not None and args.chunk_rows < 1:
+        sys.exit("Error: --chunk-rows must be a positive integer.")
+    if args.result_cache_entries < 1:
+        sys.exit("Error: --result-cache-entries must be a positive integer.")
+    if args.poll_seconds < 0:
+        sys.exit("Error: --poll-seconds cannot be negative.")
+
+    socket_path = None
+    if args.socket:
+        socket_path = os.path.abspath(os.path.expanduser(args.socket))
+        if os.path.exists(socket_path):
+            # a socket left behind by a previous server is replaced, anything else is not
+            if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                sys.exit(f"Error: --socket path exists and is not a socket → {socket_path}")
+            os.unlink(socket_path)
+
+    print(f"Jobs dir: {jobs_dir}")
+    print(f"Capacities dir: {capacities_dir}")
+    print(f"Cache dir: {cache_dir}")
+
+    try:
+        store = JobStore(jobs_dir, capacities_dir, cache_dir=cache_dir,
+                         max_cache_bytes=int(args.cache_max_gb * 1000**3),
+                         workers=args.workers, chunk_rows=args.chunk_rows)
+    except FileNotFoundError as e:
+        sys.exit(f"Error: {e}")
+    print(f"Loaded {store.status()['jobs']} jobs from {len(store.files)} logs")
+
+    service = ReportService(store, ResultCache(args.result_cache_entries))
+    serve(service, host=args.host, port=args.port, socket_path=socket_path, poll_seconds=args.poll_seconds)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+On-disk cache of preprocessed sacct logs.
+
+Each JobList_*.txt file is preprocessed once and stored as a Parquet file in
+the cache directory. Entries are keyed by:
+
+- the resolved source path, its size and modification time
+- CACHE_VERSION, bumped whenever preprocessing changes its output
+
+Each entry also records the key of the capacity mapping used for GPU
+assignment and its horizon, the latest time at which its jobs were resolved
+against the capacity. An entry is only used when the current capacity gives
+the same key up to that horizon, so snapshots added after the jobs of a log
+ran do not invalidate it. A changed source file therefore misses the cache,
+and the stale entry for that source file is removed when the new one is written.
+The cache is bounded in size; the least recently used entries are evicted first.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+CACHE_VERSION = 4
+
+DEFAULT_CACHE_DIR = Path("~/.cache/hpc-utilisation-reporter").expanduser()
+DEFAULT_MAX_CACHE_BYTES = 10 * 1000**3
+
+
+def _digest(obj) -> str:
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def mapping_key(*mappings) -> str:
+    """Return a short key identifying the capacity mappings used to preprocess jobs."""
+    return _digest(mappings)
+
+def frame_key(df: pd.DataFrame) -> str:
+    """Return a short key identifying the contents of a DataFrame, independent of row order."""
+    columns = sorted(df.columns)
+    row_hashes = pd.util.hash_pandas_object(df[columns], index=False).sort_values()
+    return hashlib.sha256(row_hashes.to_numpy().tobytes() + str(columns).encode()).hexdigest()[:16]
+
+def _entry_path(cache_dir: Path, source: Path) -> Path:
+    """Return the cache file for a source file in its current state."""
+    source = source.resolve()
+    stat = source.stat()
+    signature = _digest([CACHE_VERSION, stat.st_size, stat.st_mtime_ns])
+    return cache_dir / f"{_digest(str(source))}-{signature}.parquet"
+
+def load_frame(cache_dir, source, map_key) -> pd.DataFrame | None:
+    """
+    Return the cached preprocessed frame for a source file, or None on a miss.
+    map_key is called with the horizon stored with the entry and must return
+    the key the entry was stored under (see store_frame).
+    """
+    entry = _entry_path(Path(cache_dir), Path(source))
+    try:
+        metadata = pq.read_schema(entry).metadata
+        if metadata.get(b"map_key", b"").decode() != map_key(json.loads(metadata.get(b"horizon", b"null"))):
+            return None
+        os.utime(entry)  # mark as recently used for eviction
+        return pd.read_parquet(entry)
+    except FileNotFoundError:
+        return None
+
+def store_frame(cache_dir, source, map_key: str, df: pd.DataFrame,
+                max_bytes: int = DEFAULT_MAX_CACHE_BYTES, horizon=None) -> None:
+    """
+    Cache the preprocessed frame of a source file, replacing stale entries.
+    horizon (JSON-serialisable) is stored with the entry and passed back to
+    the map_key function of load_frame.
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    entry = _entry_path(cache_dir, Path(source))
+
+    # Invalidate older entries for the same source file
+    source_prefix = entry.name.split("-")[0]
+    for stale in cache_dir.glob(f"{source_prefix}-*.parquet"):
+        stale.unlink(missing_ok=True)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **table.schema.metadata,
+        b"map_key": map_key.encode(),
+        b"horizon": json.dumps(horizon).encode(),
+    })
+    tmp = entry.with_suffix(".tmp")
+    pq.write_table(table, tmp)
+    tmp.replace(entry)
+
+    evict(cache_dir, max_bytes)
+
+def _stat(path: Path):
+    """Return the stat of a cache entry, or None if another process removed it."""
+    try:
+        return path.stat()
+    except FileNotFoundError:
+        return None
+
+def evict(cache_dir, max_bytes: int) -> None:
+    """Delete least recently used entries until the cache is at most max_bytes."""
+    stats = [(p, _stat(p)) for p in Path(cache_dir).glob("*.parquet")]
+    entries = sorted(((p, st) for p, st in stats if st is not None), key=lambda e: e[1].st_mtime)
+    total = sum(st.st_size for _, st in entries)
+
+    for entry, st in entries:
+        if total <= max_bytes:
+            break
+        total -= st.st_size
+        entry.unlink(missing_ok=True)
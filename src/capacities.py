@@ -1,14 +1,61 @@
 import subprocess
 import io
+import numpy as np
 import pandas as pd
 import re
 import shlex
 import os
+import time
+import warnings
+from pathlib import Path
 
-def _extract_capacity_data() -> io.StringIO:
-    """Run `sinfo` and return cleaned node capacity data as a stream."""
+# Cached sinfo output younger than this is used instead of running sinfo
+DEFAULT_SINFO_MAX_AGE = 3600
+
+_SINFO_CACHE_FILE = "sinfo.txt"
+_CAPACITY_FILE_RE = re.compile(r'^capacities-(\d{4}_\d{2}_\d{2})\.txt$')
+
+def _run_sinfo() -> str:
+    """Run `sinfo` and return its raw node capacity output. Raises RuntimeError if it fails."""
     cmd = shlex.split('sinfo -a --format=%N|%P|%c|%m|%G -N')
-    raw_output = subprocess.run(cmd, capture_output=True, text=True).stdout
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except OSError as e:
+        raise RuntimeError(f"Cannot run sinfo: {e}") from e
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(cmd)} failed with exit code {result.returncode}: {result.stderr.strip()}")
+    return result.stdout
+
+def _extract_capacity_data(cache_dir=None, max_age: float = DEFAULT_SINFO_MAX_AGE,
+                           offline: bool = False) -> io.StringIO | None:
+    """
+    Return the raw `sinfo` output as a stream. With cache_dir, output younger
+    than max_age seconds is reused and new output is saved. When offline or when
+    sinfo cannot be run, cached output of any age is used, or None is returned.
+    """
+    cached = Path(cache_dir) / _SINFO_CACHE_FILE if cache_dir else None
+    age = time.time() - cached.stat().st_mtime if cached and cached.exists() else None
+    if age is not None and (offline or age < max_age):
+        return io.StringIO(cached.read_text())
+    if offline:
+        return None
+
+    try:
+        raw_output = _run_sinfo()
+    except RuntimeError as e:
+        if age is None:
+            if cache_dir is None:
+                raise
+            warnings.warn(f"{e}; falling back to the capacity store")
+            return None
+        warnings.warn(f"{e}; using the sinfo output cached {age / 3600:.1f} hours ago")
+        return io.StringIO(cached.read_text())
+
+    if cached:
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cached.with_suffix(".tmp")
+        tmp.write_text(raw_output)
+        tmp.replace(cached)
     return io.StringIO(raw_output)
 
 def _read_and_normalise(raw_data_file: str) -> pd.DataFrame:
@@ -70,32 +117,50 @@ def _process_capacity_data(raw_data_file) -> pd.DataFrame:
     df[gpu_counts.columns] = df[gpu_counts.columns].astype(int)
     return df
 
-def get_capacities() -> pd.DataFrame:
-    """Return processed Slurm node capacity data as a DataFrame."""
-    raw_capacity_data = _extract_capacity_data()
+def get_capacities(cache_dir=None, max_age: float = DEFAULT_SINFO_MAX_AGE, offline: bool = False) -> pd.DataFrame:
+    """
+    Return processed Slurm node capacity data as a DataFrame.
+
+    cache_dir is the capacity store directory (see src.capacity_store): the
+    sinfo output is cached there for max_age seconds. If offline, or if sinfo
+    cannot be run and nothing is cached, the latest stored snapshot is returned.
+    """
+    raw_capacity_data = _extract_capacity_data(cache_dir, max_age, offline)
+    if raw_capacity_data is None:
+        # imported here because the store itself parses capacity files with this module
+        from src.capacity_store import capacity_as_of
+        latest = capacity_as_of(cache_dir)
+        if latest.empty:
+            raise RuntimeError(f"No cached sinfo output or stored capacity snapshot in {cache_dir}")
+        return latest
     processed_capacity_data = _process_capacity_data(raw_capacity_data)
     return processed_capacity_data
 
+def list_capacity_files(directory) -> list[tuple[pd.Timestamp, str]]:
+    """Return (snapshot date, path) of the 'capacities-YYYY_MM_DD.txt' files in a directory, oldest first."""
+    files = []
+    for fname in os.listdir(directory):
+        match = _CAPACITY_FILE_RE.match(fname)
+        if not match:
+            # Skip files not matching the hard-coded format
+            continue
+        # e.g. "2025_08_26"
+        files.append((pd.to_datetime(match.group(1), format="%Y_%m_%d"), os.path.join(directory, fname)))
+    return sorted(files)
+
+def read_capacity_file(path) -> pd.DataFrame:
+    """Process one capacity snapshot file."""
+    return _process_capacity_data(path)
+
 def get_capacity_history(directory: str) -> pd.DataFrame:
     """
     Read capacity files in the format 'capacities-YYYY_MM_DD.txt',
     process each file, and concatenate into a single DataFrame with a 'date' column.
     Missing resource values are normalized to 0.
     """
-    pattern = re.compile(r'^capacities-(\d{4}_\d{2}_\d{2})\.txt$')
     all_dfs = []
 
-    for fname in os.listdir(directory):
-        match = pattern.match(fname)
-        if not match:
-            # Skip files not matching the hard-coded format
-            continue
-
-        date_str = match.group(1)  # e.g. "2025_08_26"
-        # Convert to datetime
-        date = pd.to_datetime(date_str, format="%Y_%m_%d")
-
-        fpath = os.path.join(directory, fname)
+    for date, fpath in list_capacity_files(directory):
         df = _process_capacity_data(fpath)
         df['date'] = date
         all_dfs.append(df)
@@ -114,39 +179,120 @@ def get_capacity_history(directory: str) -> pd.DataFrame:
 
     return combined
 
+def _snapshot_intervals(history_df, start, end) -> pd.DataFrame:
+    """
+    Attach to every snapshot row the interval [valid_from, valid_to) during which it
+    describes its node: from the snapshot date until the node's next snapshot date,
+    clipped to [start, end). Rows that are not in effect within the window are dropped.
+    Rows are ordered by node, then date, keeping the input order within a snapshot.
+    """
+    start_date = pd.to_datetime(start)
+    end_date = pd.to_datetime(end)  # exclusive
+
+    history = history_df.dropna(subset=["node"])
+    snapshots = (
+        history[["node", "date"]]
+        .drop_duplicates()
+        .sort_values(["node", "date"], kind="mergesort")
+    )
+    snapshots["next_date"] = snapshots.groupby("node")["date"].shift(-1).fillna(end_date)
+
+    intervals = (
+        history
+        .merge(snapshots, on=["node", "date"], how="left")
+        .sort_values(["node", "date"], kind="mergesort")
+        .assign(valid_from=lambda d: d["date"].clip(lower=start_date),
+                valid_to=lambda d: d["next_date"].clip(upper=end_date))
+        .drop(columns=["next_date"])
+    )
+    return intervals[intervals["valid_to"] > intervals["valid_from"]].reset_index(drop=True)
+
+def expand_capacity_intervals(history_df, start, end):
+    """
+    Return one row per node/partition state with the interval [valid_from, valid_to)
+    in which it applies, clipped to [start, end). Consecutive snapshots in which a
+    row is unchanged are merged into a single interval.
+    """
+    intervals = _snapshot_intervals(history_df, start, end).drop(columns=["date"])
+    state_cols = [c for c in intervals.columns if c not in ("valid_from", "valid_to")]
+
+    # a new run starts whenever the state changes or the previous interval does not touch this one
+    intervals = intervals.sort_values(state_cols + ["valid_from"], kind="mergesort")
+    same_state = intervals[state_cols].eq(intervals[state_cols].shift()).all(axis=1)
+    contiguous = intervals["valid_from"].eq(intervals["valid_to"].shift())
+    run_id = (~(same_state & contiguous)).cumsum()
+
+    runs = (
+        intervals
+        .groupby(run_id, sort=False)
+        .agg({**{c: "first" for c in state_cols}, "valid_from": "min", "valid_to": "max"})
+        .sort_values(["node", "valid_from"], kind="mergesort")
+    )
+    return runs.reset_index(drop=True)
+
 def expand_capacity_snapshots(history_df, start, end):
     """
     Expand each node's snapshots into daily rows until the next snapshot date.
     Partition membership changes are reflected exactly when they occur.
+    Columns are those of history_df with date last. Rows are ordered
+    by node and day, in snapshot order within a day, so repeated unchanged
+    snapshots do not affect the output.
     Start is inclusive, end is exclusive.
     """
-    filled = []
-    start_date = pd.to_datetime(start)
-    end_date = pd.to_datetime(end)  # exclusive
+    intervals = _snapshot_intervals(history_df, start, end)
+    resource_cols = [c for c in history_df.columns if c not in ("date", "node", "partition")]
+
+    days = (intervals["valid_to"] - intervals["valid_from"]).dt.days.to_numpy()
+    rows = np.repeat(np.arange(len(intervals)), days)
+    day_offsets = np.arange(len(rows)) - np.repeat(np.cumsum(days) - days, days)
 
-    for node, group in history_df.groupby("node"):
-        g = group.sort_values("date").reset_index(drop=True)
+    filled = intervals.iloc[rows].reset_index(drop=True)
+    filled["date"] = filled["valid_from"] + pd.to_timedelta(day_offsets, unit="D")
+    filled[resource_cols] = filled[resource_cols].astype(float)
+    filled = filled.sort_values(["node", "date"], kind="mergesort")
+    columns = [c for c in history_df.columns if c != "date"] + ["date"]
+    return filled[columns].reset_index(drop=True)
 
-        for idx in range(len(g)):
-            row_date = g.loc[idx, "date"]
+# Partition of the capacity_timeseries rows that count every node once
+CLUSTER_PARTITION = "(cluster)"
 
-            # Determine next cutoff (next snapshot for this node)
-            if idx < len(g) - 1:
-                next_date = g.loc[idx + 1, "date"]
-            else:
-                next_date = end_date  # exclusive bound
+def capacity_timeseries(history_df, resources, start, end, freq) -> pd.DataFrame:
+    """
+    Return the capacity of each partition at every snapshot time of [start, end)
+    at freq, plus CLUSTER_PARTITION rows in which each node counts once.
+
+    Snapshot rows are joined to the grid by their validity intervals (see
+    _snapshot_intervals): a row is added at the first snapshot time at or after
+    valid_from and removed at the first one at or after valid_to, and the
+    levels are cumulative sums of these events. No daily rows are built, so the
+    cost is linear in the history rows plus the grid. A node in several
+    partitions counts fully towards each of them.
+    """
+    grid_times = pd.date_range(start=start, end=end, freq=freq, inclusive="left")
+    columns = ["snapshot time", "partition"] + list(resources)
+    if history_df.empty or not len(grid_times):
+        return pd.DataFrame(columns=columns)
 
-            # Build daily range: inclusive start, exclusive end
-            calendar = pd.date_range(
-                start=max(start_date, row_date),
-                end=min(end_date - pd.Timedelta(days=1), next_date - pd.Timedelta(days=1)),
-                freq="D"
-            )
+    intervals = _snapshot_intervals(history_df, start, end).dropna(subset=["partition"])
+    # the rows of a node's snapshot describe the same node, one per partition
+    nodes = intervals.drop_duplicates(["node", "date"]).assign(partition=CLUSTER_PARTITION)
+    rows = pd.concat([intervals, nodes], ignore_index=True)
 
-            snapshot = g[g["date"] == row_date]
-            for _, row in snapshot.iterrows():
-                dup = pd.DataFrame([row.to_dict()] * len(calendar))
-                dup["date"] = calendar
-                filled.append(dup)
+    grid = grid_times.to_numpy(dtype="datetime64[ns]")
+    codes, partitions = pd.factorize(rows["partition"])
+    width = len(grid) + 1
+    added = codes * width + np.searchsorted(grid, rows["valid_from"].to_numpy(dtype="datetime64[ns]"))
+    removed = codes * width + np.searchsorted(grid, rows["valid_to"].to_numpy(dtype="datetime64[ns]"))
 
-    return pd.concat(filled, ignore_index=True)
+    capacity = pd.DataFrame({
+        "snapshot time": np.tile(grid_times, len(partitions)),
+        "partition": np.repeat(np.asarray(partitions, dtype=object), len(grid)),
+    })
+    size = len(partitions) * width
+    for resource in resources:
+        values = rows[resource].to_numpy(dtype=np.float64) if resource in rows else np.zeros(len(rows))
+        deltas = np.bincount(added, weights=values, minlength=size) - np.bincount(removed, weights=values, minlength=size)
+        levels = np.cumsum(deltas.reshape(-1, width), axis=1)[:, :-1]
+        # round away the float noise of the running sums
+        capacity[resource] = np.round(levels, 6).ravel()
+    return capacity
@@ -8,18 +8,23 @@ from the processed capacity data, and for building lookup maps such as:
 - get_node_to_gpu_map: maps each node to the GPU types it provides
 - get_partition_to_gpu_map: maps each partition to the GPU types available
   across its nodes
+- get_gpu_type_history: time-indexed version of the two maps above, built
+  from the capacity history, with lookup_gpu_types to resolve it at given times
 
 These helpers are used by the queue preprocessing logic to assign jobs to
 specific GPU resources where possible.
 """
 
+from typing import NamedTuple
+
+import numpy as np
 import pandas as pd
 
 def get_gpu_types(capacity_df: pd.DataFrame) -> list[str]:
     """
     Return a sorted list of GPU type columns from the processed capacity DataFrame.
     """
-    non_gpu_cols = {"node", "partition", "cpu", "mem_gb"}
+    non_gpu_cols = {"node", "partition", "cpu", "mem_gb", "date"}
     return sorted([c for c in capacity_df.columns if c not in non_gpu_cols])
 
 
@@ -49,3 +54,63 @@ def get_partition_to_gpu_map(capacity_df: pd.DataFrame) -> dict[str, list[str]]:
                 partition_map[p].add(gpu)
 
     return {p: sorted(types) for p, types in partition_map.items()}
+
+
+class GpuTypeHistory(NamedTuple):
+    """GPU type uniquely provided by each node or partition at each snapshot date."""
+    dates: np.ndarray       # sorted snapshot dates (datetime64[ns])
+    keys: pd.Index          # node or partition names
+    gpu_types: list[str]
+    codes: np.ndarray       # [date, key] index into gpu_types, -1 if none or not unique
+
+
+def get_gpu_type_history(history_df: pd.DataFrame, key: str) -> GpuTypeHistory:
+    """
+    Build the time-indexed GPU type map of each node (key="node") or partition
+    (key="partition") from the capacity history.
+
+    As in expand_capacity_snapshots, a node's snapshot stays in effect until that
+    node's next snapshot. A partition maps to a GPU type at a date when exactly
+    one GPU type is present across the nodes in effect in it at that date.
+    """
+    gpu_cols = get_gpu_types(history_df)
+    history = history_df.dropna(subset=["node", key])
+    dates = np.sort(history["date"].unique()).astype("datetime64[ns]")
+    keys = pd.Index(history[key].unique())
+
+    # validity of each row in snapshot positions: [from_idx, to_idx)
+    node_dates = history[["node", "date"]].drop_duplicates().sort_values(["node", "date"])
+    node_dates["next_date"] = node_dates.groupby("node")["date"].shift(-1)
+    rows = history.merge(node_dates, on=["node", "date"], how="left")
+    from_idx = np.searchsorted(dates, rows["date"].to_numpy(dtype="datetime64[ns]"))
+    to_idx = np.where(rows["next_date"].isna(), len(dates),
+                      np.searchsorted(dates, rows["next_date"].to_numpy(dtype="datetime64[ns]")))
+    key_idx = keys.get_indexer(rows[key])
+
+    # count rows providing each (key, gpu type) per date with a difference array
+    active = np.zeros((len(dates) + 1, len(keys), len(gpu_cols)), dtype=np.int32)
+    for t, gpu in enumerate(gpu_cols):
+        has_gpu = rows[gpu].to_numpy() > 0
+        np.add.at(active, (from_idx[has_gpu], key_idx[has_gpu], t), 1)
+        np.add.at(active, (to_idx[has_gpu], key_idx[has_gpu], t), -1)
+    present = np.cumsum(active, axis=0)[:-1] > 0
+
+    codes = np.where(present.sum(axis=2) == 1, present.argmax(axis=2), -1)
+    return GpuTypeHistory(dates, keys, gpu_cols, codes)
+
+
+def lookup_gpu_types(history: GpuTypeHistory, keys, times) -> np.ndarray:
+    """
+    Return the GPU type (or None) of each key at the matching time, using the
+    latest snapshot at or before that time. Times before the first snapshot use
+    the first snapshot, and missing times use the latest one.
+    """
+    times = pd.to_datetime(pd.Series(times)).to_numpy(dtype="datetime64[ns]")
+    snapshot = np.searchsorted(history.dates, times, side="right") - 1
+    snapshot = np.where(np.isnat(times), len(history.dates) - 1, snapshot.clip(min=0))
+
+    key_idx = history.keys.get_indexer(pd.Index(keys))
+    codes = np.where(key_idx >= 0, history.codes[snapshot, key_idx.clip(min=0)], -1)
+
+    names = np.array(list(history.gpu_types) + [None], dtype=object)
+    return names[codes]
@@ -0,0 +1,152 @@
+"""
+Persistent columnar store of the capacity history.
+
+Reparsing every capacities-YYYY_MM_DD.txt on every run is replaced by a
+store directory (by default `capacities/` in the cache directory) with:
+
+- history.parquet: one row per node/partition state that changed, stamped
+  with the date of the snapshot in which it changed and sorted by date
+- manifest.json: the capacity directory and the signature of every
+  snapshot file already ingested
+
+Each run ingests only the snapshot files that are newer than every stored
+one. A node's rows are stored again only when they differ from its previous
+snapshot; a node missing from a snapshot gets a "removed" row. The history
+read back is therefore the full history without its repeated rows, which
+expands into exactly the same daily snapshots and intervals. A changed,
+removed or backfilled snapshot file rebuilds the store from scratch.
+
+capacity_as_of() answers "capacity at date" from the store alone, reading
+only the row groups up to that date, so runs without Slurm can use the
+latest stored snapshot (see get_capacities).
+"""
+
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from src.capacities import list_capacity_files, read_capacity_file
+from src.incremental import file_signature
+
+STORE_VERSION = 1
+
+_HISTORY_FILE = "history.parquet"
+_MANIFEST_FILE = "manifest.json"
+_ID_COLUMNS = ["node", "partition"]
+
+
+def capacity_store_dir(cache_dir) -> Path:
+    """Return the capacity store directory inside a cache directory."""
+    return Path(cache_dir) / "capacities"
+
+def _normalise(df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+    """Give node rows the store's columns and dtypes, so equal states hash equally."""
+    df = df.reindex(columns=columns + [c for c in ("removed", "date") if c in df.columns])
+    resource_cols = [c for c in columns if c not in _ID_COLUMNS]
+    df[resource_cols] = df[resource_cols].fillna(0)
+    return df.astype({c: "float64" if c == "mem_gb" else "int64" for c in resource_cols})
+
+def _store_columns(*frames) -> list[str]:
+    """node, partition, cpu, mem_gb and then the sorted GPU types of all frames."""
+    gpu_types = {c for df in frames for c in df.columns} - {*_ID_COLUMNS, "cpu", "mem_gb", "date", "removed"}
+    return _ID_COLUMNS + ["cpu", "mem_gb"] + sorted(gpu_types)
+
+def _node_states(df: pd.DataFrame) -> pd.Series:
+    """Return each node's rows, in order, as a tuple of row hashes."""
+    row_hashes = pd.util.hash_pandas_object(df, index=False)
+    return row_hashes.groupby(df["node"].to_numpy(), sort=False).agg(tuple)
+
+def _snapshot_changes(current: pd.DataFrame, snapshot: pd.DataFrame, date, columns) -> pd.DataFrame:
+    """
+    Return the rows of the nodes whose state differs from `current`, plus a
+    removed row for every node of `current` missing from the snapshot.
+    """
+    current_states = _node_states(_normalise(current, columns))
+    states = _node_states(snapshot)
+    changed = states.index[[current_states.get(node) != state for node, state in states.items()]]
+    removed = current_states.index.difference(states.index)
+
+    changes = snapshot[snapshot["node"].isin(changed)].assign(removed=False)
+    tombstones = _normalise(pd.DataFrame({"node": removed}), columns).assign(removed=True)
+    return pd.concat([changes, tombstones], ignore_index=True).assign(date=date)
+
+def _read_manifest(store_dir: Path) -> dict | None:
+    try:
+        return json.loads((store_dir / _MANIFEST_FILE).read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def _write_store(store_dir: Path, changes: pd.DataFrame, manifest: dict) -> None:
+    """Replace the store's files; the manifest is written last so a partial update is rebuilt."""
+    store_dir.mkdir(parents=True, exist_ok=True)
+    (store_dir / _MANIFEST_FILE).unlink(missing_ok=True)
+    tmp = store_dir / f"{_HISTORY_FILE}.tmp"
+    changes.to_parquet(tmp, index=False, row_group_size=64 * 1024)
+    tmp.replace(store_dir / _HISTORY_FILE)
+    tmp = store_dir / f"{_MANIFEST_FILE}.tmp"
+    tmp.write_text(json.dumps(manifest, indent=2))
+    tmp.replace(store_dir / _MANIFEST_FILE)
+
+def _read_changes(store_dir: Path, date=None) -> pd.DataFrame:
+    filters = [("date", "<=", pd.Timestamp(date))] if date is not None else None
+    return pd.read_parquet(store_dir / _HISTORY_FILE, filters=filters)
+
+def _state(changes: pd.DataFrame) -> pd.DataFrame:
+    """Return the node rows in effect after all the given changes."""
+    latest = changes.groupby("node")["date"].transform("max")
+    rows = changes[changes["date"].eq(latest) & ~changes["removed"]]
+    return rows.drop(columns=["date", "removed"]).reset_index(drop=True)
+
+def capacity_as_of(store_dir, date=None) -> pd.DataFrame:
+    """
+    Return the capacity in effect at a date (the latest stored snapshot without
+    one) in the format of get_capacities, or an empty DataFrame if nothing is stored.
+    """
+    store_dir = Path(store_dir)
+    if _read_manifest(store_dir) is None:
+        return pd.DataFrame()
+    state = _state(_read_changes(store_dir, date))
+    return state.sort_values("node", kind="mergesort").reset_index(drop=True)
+
+def update_capacity_store(store_dir, capacities_dir) -> pd.DataFrame:
+    """
+    Ingest the new snapshot files of capacities_dir into the store and return
+    the capacity history, in the format of get_capacity_history but with only
+    the rows that changed between snapshots.
+    """
+    store_dir = Path(store_dir)
+    files = [(date, Path(path)) for date, path in list_capacity_files(capacities_dir)]
+    signatures = {path.name: file_signature(path) for _, path in files}
+
+    manifest = _read_manifest(store_dir)
+    ingested = {}
+    if manifest and manifest["version"] == STORE_VERSION \
+            and manifest["directory"] == str(Path(capacities_dir).resolve()):
+        ingested = manifest["files"]
+    new = [(date, path) for date, path in files if path.name not in ingested]
+    unchanged = all(signatures.get(name) == sig for name, sig in ingested.items())
+    if not unchanged or (new and ingested and new[0][1].name < max(ingested)):
+        ingested, new = {}, files
+
+    changes = _read_changes(store_dir) if ingested else pd.DataFrame()
+    if new:
+        snapshots = [(date, read_capacity_file(path)) for date, path in new]
+        columns = _store_columns(changes, *(df for _, df in snapshots))
+        current = _state(changes) if ingested else pd.DataFrame(columns=columns)
+        frames = [_normalise(changes, columns)] if ingested else []
+        for date, snapshot in snapshots:
+            snapshot = _normalise(snapshot.dropna(subset=["node"]), columns)
+            frames.append(_snapshot_changes(current, snapshot, date, columns))
+            current = snapshot
+        changes = pd.concat(frames, ignore_index=True).astype({"removed": bool})
+        _write_store(store_dir, changes, {
+            "version": STORE_VERSION,
+            "directory": str(Path(capacities_dir).resolve()),
+            "files": {path.name: signatures[path.name] for _, path in files},
+        })
+
+    if changes.empty:
+        return pd.DataFrame()
+    history = changes[~changes["removed"].to_numpy(dtype=bool)].drop(columns=["removed"])
+    return history[[c for c in history.columns if c != "date"] + ["date"]].reset_index(drop=True)
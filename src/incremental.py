@@ -0,0 +1,199 @@
+"""
+Checkpoints for extending existing reports with a new window (--append).
+
+A run with --checkpoint (and every append run) writes a small checkpoint
+next to its reports:
+
+- ReportCheckpoint.json: the report window and frequency, the resource
+  columns, the signature of every sacct log already ingested and the
+  per-partition totals at the last snapshot
+- ReportCheckpoint.parquet: the jobs that may still be allocated after the
+  last snapshot (no End, or ending at or after it)
+
+An append run ingests only the logs that are not in the checkpoint. The new
+window is computed from those logs plus the carried jobs that they do not
+supersede, which are exactly the jobs a full rebuild would count after the
+previous window end. JobReport.csv is extended newest first, as when all
+logs are merged, and UtilisationReport.csv is reassembled in the partition
+order of a full rebuild.
+"""
+
+import csv
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CHECKPOINT_FILE = "ReportCheckpoint.json"
+CHECKPOINT_JOBS_FILE = "ReportCheckpoint.parquet"
+
+# Job columns needed to continue the utilisation time series
+_CARRIED_COLUMNS = ["jobid", "partition", "start", "end"]
+
+
+def file_signature(path) -> dict:
+    stat = Path(path).stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def ingested_signatures(paths) -> dict:
+    """Return {resolved path: signature} for the given sacct logs."""
+    return {str(Path(p).resolve()): file_signature(p) for p in paths}
+
+def new_sacct_files(paths, checkpoint: dict) -> list[Path]:
+    """
+    Return the logs in paths that the checkpoint has not ingested yet.
+    Raises ValueError if an ingested log has changed since, as the earlier
+    window would then differ from a full rebuild.
+    """
+    ingested = checkpoint["files"]
+    new_files = []
+    for path in map(Path, paths):
+        key = str(path.resolve())
+        if key not in ingested:
+            new_files.append(path)
+        elif ingested[key] != file_signature(path):
+            raise ValueError(f"{path} has changed since it was reported; rebuild the reports in full")
+    return new_files
+
+def carried_jobs(sacct_data: pd.DataFrame, ts_res_list, last_snapshot) -> pd.DataFrame:
+    """Return the started jobs still allocated at or after the last snapshot."""
+    jobs = sacct_data.dropna(subset=["start"])
+    carried = jobs["end"].isna() | (jobs["end"] >= last_snapshot)
+    return jobs.loc[carried, _CARRIED_COLUMNS + list(ts_res_list)].reset_index(drop=True)
+
+def partition_totals(jobs: pd.DataFrame, ts_res_list, snapshot) -> dict:
+    """Return {partition: {resource: total}} of the jobs allocated at snapshot."""
+    end = jobs["end"].fillna(pd.Timestamp.max)
+    active = jobs[(jobs["start"] <= snapshot) & (end >= snapshot) & jobs["partition"].notna()]
+    totals = active.groupby("partition", observed=True)[list(ts_res_list)].sum()
+    return {str(p): {r: round(float(v), 6) for r, v in row.items()} for p, row in totals.iterrows()}
+
+def load_checkpoint(output_dir) -> tuple[dict, pd.DataFrame] | None:
+    """Return the checkpoint metadata and carried jobs in output_dir, or None if there is none."""
+    meta_path = Path(output_dir) / CHECKPOINT_FILE
+    if not meta_path.exists():
+        return None
+    checkpoint = json.loads(meta_path.read_text())
+    jobs = pd.read_parquet(Path(output_dir) / CHECKPOINT_JOBS_FILE)
+    return checkpoint, jobs
+
+def write_checkpoint(output_dir, report_start, report_end, freq, ts_res_list, files: dict,
+                     jobs: pd.DataFrame) -> None:
+    """Write the checkpoint for reports covering [report_start, report_end)."""
+    grid = pd.date_range(start=report_start, end=report_end, freq=freq, inclusive="left")
+    last_snapshot = grid[-1] if len(grid) else pd.Timestamp(report_start)
+    carried = carried_jobs(jobs, ts_res_list, last_snapshot)
+
+    checkpoint = {
+        "report_start": str(pd.Timestamp(report_start)),
+        "report_end": str(pd.Timestamp(report_end)),
+        "freq": freq,
+        "resources": list(ts_res_list),
+        "last_snapshot": str(last_snapshot),
+        "partition_totals": partition_totals(carried, ts_res_list, last_snapshot),
+        "files": files,
+    }
+    # write the jobs first so that a readable JSON always has its jobs
+    carried.to_parquet(Path(output_dir) / CHECKPOINT_JOBS_FILE, index=False)
+    (Path(output_dir) / CHECKPOINT_FILE).write_text(json.dumps(checkpoint, indent=2))
+
+def check_checkpoint(checkpoint: dict, carried: pd.DataFrame, report_start, freq, ts_res_list) -> None:
+    """Raise ValueError if an append run cannot continue from this checkpoint."""
+    if pd.Timestamp(report_start) != pd.Timestamp(checkpoint["report_end"]):
+        raise ValueError(f"--report-start must be the end of the existing reports, {checkpoint['report_end']}")
+    if freq != checkpoint["freq"]:
+        raise ValueError(f"--freq must match the existing reports, '{checkpoint['freq']}'")
+    if list(ts_res_list) != checkpoint["resources"]:
+        raise ValueError("The GPU types have changed since the existing reports; rebuild the reports in full")
+    full_grid = pd.date_range(start=checkpoint["report_start"], end=report_start, freq=freq)
+    if len(full_grid) and full_grid[-1] != pd.Timestamp(report_start):
+        raise ValueError("--report-start is not on the snapshot grid of the existing reports")
+    if partition_totals(carried, ts_res_list, pd.Timestamp(checkpoint["last_snapshot"])) \
+            != checkpoint["partition_totals"]:
+        raise ValueError("The checkpoint jobs do not match its partition totals; rebuild the reports in full")
+
+def check_report_columns(job_report_path, job_columns, util_report_path, util_columns) -> None:
+    """Raise ValueError if the existing reports do not have the columns this run writes."""
+    for path, columns in ((job_report_path, job_columns), (util_report_path, util_columns)):
+        with open(path, newline="") as f:
+            header = next(csv.reader(f), [])
+        if header != list(columns):
+            raise ValueError(f"The columns of {path} differ from this run; rebuild the reports in full")
+
+def segment_jobs(new_data: pd.DataFrame, carried: pd.DataFrame, ts_res_list) -> pd.DataFrame:
+    """Return the new jobs followed by the carried jobs they do not supersede, as a full merge would."""
+    columns = _CARRIED_COLUMNS + list(ts_res_list)
+    kept = carried[~carried["jobid"].isin(new_data["jobid"])]
+    return pd.concat([new_data[columns], kept[columns]], ignore_index=True)
+
+def append_job_report(path, new_report: pd.DataFrame) -> list[str]:
+    """
+    Prepend the new jobs to an existing JobReport.csv and drop the old rows
+    they supersede. Old rows are parsed as CSV, so quoted fields may contain
+    commas, and written back with the same quoting as pandas. Returns the
+    JobIDs of the superseded rows of started jobs.
+    """
+    path = Path(path)
+    new_ids = set(new_report["jobid"].astype(str))
+    superseded = []
+    tmp = path.with_suffix(".tmp")
+    with open(path, newline="") as old:
+        rows = csv.reader(old)
+        columns = next(rows)
+        if columns != list(new_report.columns):
+            raise ValueError(f"The columns of {path} differ from this run; rebuild the reports in full")
+        queue_col = columns.index("queue_length_sec")
+
+        new_report.to_csv(tmp, sep=",", index=False)
+        with open(tmp, "a", newline="") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            for fields in rows:
+                if fields[0] not in new_ids:
+                    writer.writerow(fields)
+                elif fields[queue_col].strip():
+                    superseded.append(fields[0])
+    tmp.replace(path)
+    return superseded
+
+def report_partition_order(job_report_path) -> list:
+    """
+    Return the partitions of the started jobs in a JobReport.csv in order of
+    first appearance, which is the partition order of UtilisationReport.csv.
+    Started jobs are the ones with a queue length.
+    """
+    jobs = pd.read_csv(job_report_path, usecols=["partition", "queue_length_sec"], dtype={"partition": str})
+    return list(pd.unique(jobs.loc[jobs["queue_length_sec"].notna(), "partition"]))
+
+def append_utilisation_report(path, new_segment: pd.DataFrame, partitions: list, grid) -> None:
+    """
+    Extend an existing UtilisationReport.csv with a new window, ordered by
+    partition then snapshot time over the full grid. Partitions missing from
+    one window are zero there, as in a full rebuild.
+    """
+    old = pd.read_csv(path, dtype={"partition": str}, parse_dates=["snapshot time"])
+    if list(old.columns) != list(new_segment.columns):
+        raise ValueError(f"The columns of {path} differ from this run; rebuild the reports in full")
+
+    combined = pd.concat([old, new_segment], ignore_index=True)
+    grid = pd.DatetimeIndex(grid)
+    resources = list(combined.columns[2:])
+
+    part_codes = pd.Index(partitions, dtype=object).get_indexer(combined["partition"])
+    snap_codes = grid.get_indexer(combined["snapshot time"])
+    keep = (part_codes >= 0) & (snap_codes >= 0)
+
+    frames = []
+    for resource in resources:
+        values = np.zeros((len(partitions), len(grid)), dtype=combined[resource].dtype)
+        values[part_codes[keep], snap_codes[keep]] = combined.loc[keep, resource].to_numpy()
+        frames.append(values.reshape(-1))
+
+    result = pd.DataFrame({
+        "snapshot time": np.tile(grid, len(partitions)),
+        "partition": np.repeat(np.asarray(partitions, dtype=object), len(grid)),
+        **dict(zip(resources, frames)),
+    })
+    tmp = Path(path).with_suffix(".tmp")
+    result.to_csv(tmp, sep=",", index=False)
+    tmp.replace(path)
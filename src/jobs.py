@@ -1,35 +1,177 @@
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 from pathlib import Path
 
-from src.utils import expand_nodelist
-from src.capacity_helpers import get_gpu_types, get_node_to_gpu_map, get_partition_to_gpu_map
+from src.cache import DEFAULT_MAX_CACHE_BYTES, frame_key, load_frame, mapping_key, store_frame
+from src.utils import encode_nodelists, parse_tres
+from src.capacity_helpers import (
+    GpuTypeHistory,
+    get_gpu_type_history,
+    get_gpu_types,
+    get_node_to_gpu_map,
+    get_partition_to_gpu_map,
+    lookup_gpu_types,
+)
+
+# Kelvin2 specific: jobs affected by a slurm database error, see preprocess_sacct_data
+DB_ERROR_FILE = Path("/mnt/scratch2/service-reporting/input_data/db_errors/20250609.txt")
+
+# sacct fields read when streaming (ElapsedRaw is recomputed from Start/End)
+STREAM_FIELDS = ["JobID", "User", "Partition", "Submit", "Start", "End",
+                 "State", "NodeList", "ReqTRES", "AllocTRES"]
+
+# Rough peak bytes per raw row while a chunk is being preprocessed
+CHUNK_BYTES_PER_ROW = 4000
+
+# Columns of the job table stored as categoricals (nodelist holds the Slurm hostlist)
+CATEGORY_COLUMNS = ("user", "partition", "state", "nodelist")
+
+# Integer dtypes for counts in the job table, narrowest first
+_COUNT_DTYPES = (np.int16, np.int32)
+
+SACCT_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# Columns of JobReport.csv, followed by one column per GPU type
+JOB_REPORT_COLUMNS = ["jobid", "user", "partition", "submit", "state", "elapsedraw",
+                      "queue_length_sec", "scheduling_coeff", "cpu", "mem_gb"]
 
-def concat_sacct_data(directory):
+# First day of the period a log covers, from its name: JobList_2025-01.txt or JobList_2025-01-06.txt
+_LOG_DATE_RE = re.compile(r"^JobList_(\d{4}-\d{2}(?:-\d{2})?)\.txt$")
+
+def read_sacct_file(path) -> pd.DataFrame:
+    """Read a pipe-delimited sacct log with every field as a string."""
+    return (
+        pd.read_csv(path, sep="|", dtype=str)
+          .assign(JobID=lambda df: df.JobID.astype(str))
+    )
+
+def read_sacct_chunks(path, chunk_rows: int):
+    """Yield a sacct log in chunks of at most chunk_rows rows, reading only STREAM_FIELDS."""
+    with pd.read_csv(path, sep="|", dtype=str, usecols=STREAM_FIELDS, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield chunk.assign(JobID=lambda df: df.JobID.astype(str))
+
+def chunk_rows_for_memory(max_memory_bytes: int) -> int:
+    """Return the chunk size that keeps chunk preprocessing within max_memory_bytes."""
+    return max(1000, int(max_memory_bytes // CHUNK_BYTES_PER_ROW))
+
+def list_sacct_files(directory) -> list[Path]:
+    """Return the JobList_*.txt files in a directory, newest first."""
     raw_dir = Path(directory)
-    
+
     files = sorted(raw_dir.glob("JobList_*.txt"), reverse=True) # sorted for later drop_duplicates
 
     if not files:
         raise FileNotFoundError(f"No JobList_*.txt files found in {raw_dir}")
 
-    # Load each file into a DataFrame
-    dfs = []
-    for f in files:
-        df = pd.read_csv(f, sep="|", dtype=str)
-        dfs.append(df)
+    return files
 
-    # Concatenate all DataFrames
-    combined = pd.concat(dfs, ignore_index=True)
+def _log_start(path) -> pd.Timestamp | None:
+    match = _LOG_DATE_RE.match(Path(path).name)
+    return pd.Timestamp(match.group(1)) if match else None
 
-    # Normalise JobID and drop duplicates
-    combined = (
-        combined
-        .assign(JobID=lambda df: df.JobID.astype(str))
-        .drop_duplicates("JobID", keep="first")
-    )
+def window_sacct_files(files, window_start) -> list[Path]:
+    """
+    Return the logs that can hold the newest record of a job active at or
+    after window_start. Logs cover consecutive periods and are named by the
+    first day of their period, so every such job is in the newest log that
+    starts on or before window_start or in a later one, and older logs are
+    skipped. Logs without a date in their name are always kept.
+    """
+    starts = {Path(f): _log_start(f) for f in files}
+    covering = [start for start in starts.values() if start is not None and start <= pd.Timestamp(window_start)]
+    if not covering:
+        return list(starts)
+    first = max(covering)
+    return [f for f, start in starts.items() if start is None or start >= first]
 
+def in_window(submit: pd.Series, end: pd.Series, window) -> np.ndarray:
+    """
+    Return which jobs can be active in window = (start, end): submitted
+    before its end and not ended before its start. Missing times never
+    exclude a job.
+    """
+    window_start, window_end = map(pd.Timestamp, window)
+    return ~((submit >= window_end) | (end < window_start)).to_numpy()
+
+def window_jobs(df, window) -> pd.DataFrame:
+    """Return the jobs of a preprocessed frame that can be active in window, deduplicated by JobID first."""
+    df = df.drop_duplicates("jobid", keep="first")
+    return df[in_window(df["submit"], df["end"], window)]
+
+def _concat_frames(frames) -> pd.DataFrame:
+    """
+    Concatenate frames (DataFrames or Arrow tables) as they arrive. Each frame
+    is moved into an Arrow table and released, and the combined table is
+    converted back column by column, freeing each Arrow column as it goes, so
+    peak memory stays close to the size of the result rather than a multiple
+    of it. Categorical columns stay categorical with the union of the categories.
+    """
+    tables = [
+        (df if isinstance(df, pa.Table) else pa.Table.from_pandas(df, preserve_index=False))
+        .replace_schema_metadata()
+        for df in frames
+    ]
+    table = pa.concat_tables(tables, promote_options="permissive")
+    del tables
+    combined = table.to_pandas(self_destruct=True, split_blocks=True, deduplicate_objects=False)
+    del table
+
+    # per-type TRES counts only exist in frames where that GPU type appears
+    for col in [c for c in combined.columns if c.startswith(("gres/gpu:", "req_gres/gpu:"))]:
+        combined[col] = _narrow_counts(combined[col].fillna(0))
     return combined
 
+def _drop_seen(frames, column: str):
+    """
+    Yield frames (DataFrames or Arrow tables) without the rows whose column
+    value repeats within a frame or appeared in an earlier one, keeping the
+    first. The values seen are released once the frames are exhausted.
+    """
+    seen = set()
+    for df in frames:
+        ids = df.column(column).to_pandas() if isinstance(df, pa.Table) else df[column]
+        keep = ~(ids.duplicated(keep="first") | ids.isin(seen)).to_numpy()
+        seen.update(ids[keep])
+        if not keep.all():
+            df = df.filter(pa.array(keep)) if isinstance(df, pa.Table) else df[keep]
+        yield df
+
+def merge_sacct_data(frames) -> pd.DataFrame:
+    """
+    Concatenate preprocessed frames (DataFrames or Arrow tables, newest first)
+    and drop duplicate JobIDs, keeping the record from the newest file. Frames are deduplicated as they
+    arrive, so a generator of frames never holds superseded records.
+    """
+    return _concat_frames(_drop_seen(frames, "jobid"))
+
+def _narrow_counts(col: pd.Series) -> pd.Series:
+    """Return an integer column as the narrowest of _COUNT_DTYPES that holds its values."""
+    lo, hi = (col.min(), col.max()) if len(col) else (0, 0)
+    for dtype in _COUNT_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return col.astype(dtype)
+    return col.astype(np.int64)
+
+def compact_sacct_data(df) -> pd.DataFrame:
+    """
+    Return the compact job table: CATEGORY_COLUMNS as categoricals and
+    integer counts as int16 or int32. Times stay datetime64 and fractional
+    values float64, so reports are unchanged. Applying it twice is harmless.
+    """
+    counts = {col: _narrow_counts(df[col]) for col in df.columns if pd.api.types.is_integer_dtype(df[col])}
+    categories = {col: "category" for col in CATEGORY_COLUMNS if col in df.columns}
+    return df.assign(**counts).astype(categories)
+
+def job_nodes(df) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return the nodes of each job as the flat CSR arrays of encode_nodelists."""
+    return encode_nodelists(df["nodelist"])
+
 def assign_gpus(row, gpu_types, node_to_gpu_map, partition_to_gpu_map):
     """Assign GPU counts to job row using node, TRES, and partition mappings."""
     row = row.copy()
@@ -67,11 +209,118 @@ def assign_gpus(row, gpu_types, node_to_gpu_map, partition_to_gpu_map):
     # Final fallback: mark as indeterminate
     row["indeterminate_gpu"] += remaining_gpu
     return row
-   
 
 
-def preprocess_sacct_data(raw_data_df, capacities_df) -> pd.DataFrame:
+def _repeated_sum(value: np.ndarray, count: np.ndarray) -> np.ndarray:
+    """Return value added to zero count times, rounding like a running += loop."""
+    total = value * count
+    # multiplication only differs from repeated addition for non-integral values
+    inexact = (count > 1) & (value != np.floor(value))
+    if inexact.any():
+        v, c = value[inexact], count[inexact]
+        acc = np.zeros(len(v))
+        for step in range(1, int(c.max()) + 1):
+            acc[c >= step] += v[c >= step]
+        total[inexact] = acc
+    return total
+
+def assign_gpus_columnar(df, gpu_types, node_to_gpu_map, partition_to_gpu_map, nodes=None) -> pd.DataFrame:
+    """
+    Columnar equivalent of applying assign_gpus to every row.
+
+    Node names are mapped to GPU types once per distinct node, matches are
+    counted per job, and the TRES, partition and indeterminate fallbacks are
+    applied as masked column operations. As with the row-wise version, a GPU
+    column only becomes float when it received a fractional (per-node) share.
+
+    nodes is the CSR encoding of the job nodelists from encode_nodelists; it is
+    derived from the 'nodelist' hostlists when not given. The node and
+    partition maps may also be GpuTypeHistory lookups, in which case each job
+    is resolved against the capacity in effect at its start time.
+    """
+    df = df.copy()
+    if nodes is None:
+        nodes = job_nodes(df)
+    offsets, node_ids, node_names = nodes
+
+    gpu_total = df["gpu"].to_numpy(dtype=float)
+    gpu_per_node = df["gpu_per_node"].to_numpy(dtype=float)
+    has_gpu = gpu_total != 0
+    target_cols = list(gpu_types) + ["indeterminate_gpu"]
+    values = {col: df[col].to_numpy(dtype=float) for col in target_cols}
+    is_float = dict.fromkeys(target_cols, False)
+
+    # Node-level assignment, counted per (job position, gpu type)
+    type_index = {gpu_type: i for i, gpu_type in enumerate(gpu_types)}
+    entry_job = np.repeat(np.arange(len(df)), np.diff(offsets))
+    if isinstance(node_to_gpu_map, GpuTypeHistory):
+        # resolve only the nodes of GPU jobs, against the capacity at job start
+        entry_type = np.full(len(entry_job), -1, dtype=np.int64)
+        gpu_entries = np.flatnonzero(has_gpu[entry_job])
+        entry_names = lookup_gpu_types(node_to_gpu_map, node_names[node_ids[gpu_entries]],
+                                       df["start"].to_numpy()[entry_job[gpu_entries]])
+        entry_type[gpu_entries] = [type_index.get(t, -1) for t in entry_names]
+    else:
+        node_type = np.array([type_index.get(node_to_gpu_map.get(n), -1) for n in node_names], dtype=np.int64)
+        entry_type = node_type[node_ids]
+    matched = has_gpu[entry_job] & (entry_type >= 0)
+    type_counts = np.bincount(
+        entry_job[matched] * len(gpu_types) + entry_type[matched],
+        minlength=len(df) * len(gpu_types),
+    ).reshape(len(df), len(gpu_types))
+
+    assigned_count = np.zeros(len(df), dtype=np.int64)
+    for i, gpu_type in enumerate(gpu_types):
+        count = type_counts[:, i]
+        if not count.any():
+            continue
+        values[gpu_type] += _repeated_sum(gpu_per_node, count)
+        is_float[gpu_type] = True
+        assigned_count += count
+    assigned = _repeated_sum(gpu_per_node, assigned_count)
+
+    # Remaining GPUs fall through to the TRES, partition and indeterminate fallbacks
+    remaining = gpu_total - assigned
+    pending = has_gpu & (remaining > 0)
+    float_remaining = assigned_count > 0
+
+    if "gpu_type_tres_per_node" in df.columns:
+        tres_type = df["gpu_type_tres_per_node"].to_numpy()
+        for gpu_type in gpu_types:
+            mask = pending & (tres_type == gpu_type)
+            values[gpu_type][mask] += remaining[mask]
+            is_float[gpu_type] |= bool((mask & float_remaining).any())
+            pending &= ~mask
+
+    if isinstance(partition_to_gpu_map, GpuTypeHistory):
+        part_type = lookup_gpu_types(partition_to_gpu_map, df["partition"], df["start"])
+    else:
+        part_type = df["partition"].map(partition_to_gpu_map).to_numpy()
+    for gpu_type in gpu_types:
+        mask = pending & (part_type == gpu_type)
+        values[gpu_type][mask] += remaining[mask]
+        is_float[gpu_type] |= bool((mask & float_remaining).any())
+        pending &= ~mask
+
+    values["indeterminate_gpu"][pending] += remaining[pending]
+    is_float["indeterminate_gpu"] |= bool((pending & float_remaining).any())
+
+    for col in target_cols:
+        df[col] = values[col] if is_float[col] else values[col].astype(np.int64)
+    return df
+
+
+def _gpu_maps(capacities_df):
+    """
+    Return the GPU types and the node and partition maps used for GPU assignment.
+    For a capacity history (with a 'date' column) the maps are time-indexed.
+    """
     gpu_types = get_gpu_types(capacities_df)
+
+    if "date" in capacities_df.columns:
+        return (gpu_types,
+                get_gpu_type_history(capacities_df, "node"),
+                get_gpu_type_history(capacities_df, "partition"))
     
     # get node_to_gpu_map, but keep only entries where gpu is uniquely defined by node
     node_to_gpu_map = {
@@ -87,48 +336,170 @@ def preprocess_sacct_data(raw_data_df, capacities_df) -> pd.DataFrame:
         if len(gpus) == 1
     }
 
+    return gpu_types, node_to_gpu_map, partition_to_gpu_map
+
+def _capacity_horizon(df) -> str | None:
+    """
+    Return the latest start of the GPU jobs of a preprocessed frame, the last
+    time at which they are resolved against a capacity history, or None when
+    one has no start and is therefore resolved against the latest snapshot.
+    """
+    starts = df.loc[df["gpu"].ne(0), "start"]
+    if starts.isna().any():
+        return None
+    return str(starts.max()) if len(starts) else str(pd.Timestamp.min)
+
+def _cache_key(capacities_df, horizon=None) -> str:
+    """
+    Key for a cached frame: the GPU mappings and the state of the db error
+    file. For a capacity history, the mappings are the GPU types and the
+    snapshots up to horizon (see _capacity_horizon), or all of them when
+    horizon is None, so later snapshots do not change the key.
+    """
+    error_file = DB_ERROR_FILE.stat() if DB_ERROR_FILE.exists() else None
+    error_sig = (error_file.st_size, error_file.st_mtime_ns) if error_file else None
+    if "date" in capacities_df.columns:
+        history = capacities_df
+        if horizon is not None:
+            # times before the first snapshot are resolved against the first one
+            dates = capacities_df["date"]
+            history = capacities_df[dates <= max(pd.Timestamp(horizon), dates.min())]
+        capacity_sig = (get_gpu_types(capacities_df), frame_key(history))
+    else:
+        capacity_sig = _gpu_maps(capacities_df)
+    return mapping_key(capacity_sig, error_sig)
+
+def preprocess_sacct_data(raw_data_df, capacities_df, window=None) -> pd.DataFrame:
+    """
+    Return the compact job table (see compact_sacct_data) of a raw sacct log,
+    with parsed TRES, times, queueing metrics and per-type GPU counts.
+
+    With window = (start, end), duplicate JobIDs are dropped (keeping the
+    first, as merge_sacct_data does) and only the jobs that can be active in
+    the window are kept, using Submit and End alone, before any TRES, node
+    or GPU work.
+    """
+    gpu_types, node_to_gpu_map, partition_to_gpu_map = _gpu_maps(capacities_df)
+
     # the following lines are specific to Kelvin2 to account for slurm database error
-    error_file = Path("/mnt/scratch2/service-reporting/input_data/db_errors/20250609.txt")
-    if error_file.exists():
-        with error_file.open() as f:
+    if DB_ERROR_FILE.exists():
+        with DB_ERROR_FILE.open() as f:
             affected_jobs = [line.strip() for line in f if line.strip()]
         raw_data_df.loc[raw_data_df['JobID'].isin(affected_jobs), 'State'] = 'COMPLETED'
         raw_data_df.loc[raw_data_df['JobID'].isin(affected_jobs), 'End'] = '2025-06-09T06:00:00'
 
-    
+    if window is not None:
+        raw_data_df = raw_data_df.drop_duplicates('JobID', keep='first')
+        raw_data_df = raw_data_df[in_window(
+            pd.to_datetime(raw_data_df['Submit'], format=SACCT_TIME_FORMAT, errors="coerce"),
+            pd.to_datetime(raw_data_df['End'], format=SACCT_TIME_FORMAT, errors="coerce"),
+            window,
+        )]
+
+    nodes = encode_nodelists(raw_data_df['NodeList'])
+
     df = (raw_data_df.rename(columns=str.lower)
-            .assign(cpu=lambda df: df['alloctres'].str.extract(r'cpu=(\d+)').fillna(0).astype(int),
-                    node=lambda df: df['alloctres'].str.extract(r'node=(\d+)').fillna(0).astype(int),
-                    nodelist=lambda df: df['nodelist'].astype(str).apply(expand_nodelist).str.split(','),
-                    gpu=lambda df: df['alloctres'].str.extract(r'gpu=(\d+)').fillna(0).astype(int),
-                    gpu_per_node=lambda df: df["gpu"].div(df["node"]).fillna(0),
-                    mem_gb=lambda df: df['alloctres'].str.extract(r'mem=(\d*\.?\d+)([KMGTP])')
-                        .apply(lambda x: float(x[0]) * {'K': 1/(1000**2), 'M': 1/1000, 'G': 1, 'T': 1000}.get(x[1], 1), axis=1).fillna(0).astype(float),
-                    partition_list=lambda df:df['partition'].str.split(","),
+            .pipe(lambda df: df.join(parse_tres(df['alloctres']))
+                               .join(parse_tres(df['reqtres']).add_prefix('req_')))
+            .assign(gpu_per_node=lambda df: df["gpu"].div(df["node"]).fillna(0),
                     indeterminate_gpu=lambda df:pd.Series([0] * len(df), index=df.index),
-                    submit=lambda df:pd.to_datetime(df['submit'], format='%Y-%m-%dT%H:%M:%S',errors="coerce"),
-                    start=lambda df:pd.to_datetime(df['start'], format='%Y-%m-%dT%H:%M:%S',errors="coerce"),
-                    end=lambda df:pd.to_datetime(df['end'], format='%Y-%m-%dT%H:%M:%S',errors="coerce"),
+                    submit=lambda df:pd.to_datetime(df['submit'], format=SACCT_TIME_FORMAT,errors="coerce"),
+                    start=lambda df:pd.to_datetime(df['start'], format=SACCT_TIME_FORMAT,errors="coerce"),
+                    end=lambda df:pd.to_datetime(df['end'], format=SACCT_TIME_FORMAT,errors="coerce"),
                     #elapsedraw=lambda x: pd.to_numeric(x["elapsedraw"], errors="coerce"), # elapsedraw not accurate due to db errors
                     )    
             .assign(elapsedraw=lambda x:(x['end'] - x['start']).dt.total_seconds())
             .assign(queue_length_sec=lambda x:(x['start'] - x['submit']).dt.total_seconds())
             .assign(scheduling_coeff=lambda x:(x['elapsedraw'].div(x['elapsedraw'] + x['queue_length_sec'])))
             .assign(**{gpu:0 for gpu in gpu_types})
-            .apply(lambda row: assign_gpus(row, gpu_types, node_to_gpu_map, partition_to_gpu_map), axis=1)
-            .drop(columns=['alloctres','reqtres', 'gpu_per_node']))
+            .pipe(assign_gpus_columnar, gpu_types, node_to_gpu_map, partition_to_gpu_map, nodes)
+            .drop(columns=['alloctres','reqtres', 'gpu_per_node'])
+            .pipe(compact_sacct_data))
     return df
 
-def get_sacct_data(path, capacities):
+def stream_sacct_file(path, capacities, chunk_rows: int, window=None) -> pd.DataFrame:
+    """
+    Preprocess a sacct log chunk by chunk, so that only one raw chunk is in
+    memory next to the Arrow tables of the earlier chunks (see _concat_frames).
+    Duplicate JobIDs within the file are dropped before preprocessing, keeping
+    the first record as drop_duplicates does.
+    """
+    return _concat_frames(
+        preprocess_sacct_data(chunk, capacities, window)
+        for chunk in _drop_seen(read_sacct_chunks(path, chunk_rows), "JobID")
+    )
+
+def _preprocess_file(path, capacities, chunk_rows=None, window=None) -> pd.DataFrame:
+    if chunk_rows is None:
+        return preprocess_sacct_data(read_sacct_file(path), capacities, window)
+    return stream_sacct_file(path, capacities, chunk_rows, window)
+
+def load_sacct_file(path, capacities, cache_dir=None, max_cache_bytes=DEFAULT_MAX_CACHE_BYTES,
+                    chunk_rows=None, window=None) -> pd.DataFrame:
+    """
+    Return the preprocessed jobs of one sacct log, using the cache when given.
+    With chunk_rows, the log is streamed in chunks of that many rows. With
+    window, only the jobs that can be active in it are preprocessed; a cached
+    frame is filtered to the window, but a window is never cached itself.
+    """
+    if cache_dir is None:
+        return _preprocess_file(path, capacities, chunk_rows, window)
+
+    df = load_frame(cache_dir, path, lambda horizon: _cache_key(capacities, horizon))
+    if window is not None:
+        return _preprocess_file(path, capacities, chunk_rows, window) if df is None else window_jobs(df, window)
+    if df is None:
+        df = _preprocess_file(path, capacities, chunk_rows)
+        horizon = _capacity_horizon(df)
+        store_frame(cache_dir, path, _cache_key(capacities, horizon), df, max_cache_bytes, horizon)
+    return df
+
+def _load_sacct_table(path, capacities, cache_dir, max_cache_bytes, chunk_rows, window) -> pa.Table:
+    """Worker entry point: load one log as an Arrow table for cheap transfer."""
+    df = load_sacct_file(path, capacities, cache_dir, max_cache_bytes, chunk_rows, window)
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+def _load_parallel(files, capacities, cache_dir, max_cache_bytes, chunk_rows, window, workers):
+    """
+    Yield the job table of each file in order as an Arrow table, parsing files
+    in a process pool. Each table is released by the pool as it is yielded.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_load_sacct_table, f, capacities, cache_dir, max_cache_bytes, chunk_rows, window)
+            for f in files
+        ]
+        while futures:
+            yield futures.pop(0).result()
+
+def get_sacct_data(path, capacities, cache_dir=None, max_cache_bytes=DEFAULT_MAX_CACHE_BYTES,
+                   chunk_rows=None, workers=1, files=None, window=None):
+    """
+    Return the compact job table (see compact_sacct_data) of a single sacct
+    log or a directory of JobList_*.txt logs. With files, only those logs of
+    the directory are loaded. With cache_dir, unchanged logs are loaded from
+    the cache. With chunk_rows, logs are streamed in bounded-memory chunks.
+    With workers > 1, the logs of a directory are parsed in a process pool.
+
+    With window = (start, end), only the jobs that can be active in it are
+    returned: logs older than the one covering start are skipped (see
+    window_sacct_files) and the other logs are filtered before preprocessing.
+    """
     path = Path(path)
+    parallel = workers > 1 and path.is_dir()
 
     if path.is_file():
-        raw_sacct_data = (
-            pd.read_csv(path, sep="|", dtype=str)
-              .assign(JobID=lambda df: df.JobID.astype(str))
-        )
+        return load_sacct_file(path, capacities, cache_dir, max_cache_bytes, chunk_rows, window)
 
+    files = list_sacct_files(path) if files is None else sorted(map(Path, files), reverse=True)
+    if window is not None:
+        files = window_sacct_files(files, window[0])
+    if parallel:
+        frames = _load_parallel(files, capacities, cache_dir, max_cache_bytes,
+                                chunk_rows, window, min(workers, len(files)))
     else:
-        raw_sacct_data = concat_sacct_data(path)
-
-    return preprocess_sacct_data(raw_sacct_data, capacities)
+        frames = (
+            load_sacct_file(f, capacities, cache_dir, max_cache_bytes, chunk_rows, window)
+            for f in files
+        )
+    return merge_sacct_data(frames)
@@ -0,0 +1,114 @@
+"""
+Writing reports as CSV or as compressed columnar datasets.
+
+With the csv format each report is written to <name>.csv as before. With
+parquet or feather, reports with a time column are written as a dataset
+partitioned by month,
+
+    <name>/month=2025-01/part-0.parquet
+    <name>/month=2025-02/part-0.parquet
+
+which pyarrow.dataset, pandas.read_parquet, DuckDB and Spark read as one
+table (hive partitioning). Columns keep their types: times are timestamps,
+resources are numeric and string columns other than jobid are categorical,
+i.e. dictionary encoded.
+"""
+
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+OUTPUT_FORMATS = ("csv", "parquet", "feather")
+
+# Identifier columns with a value per job, left as strings
+_STRING_COLUMNS = ("jobid",)
+
+_COMPRESSION = "zstd"
+
+
+def to_long_layout(df: pd.DataFrame, id_columns) -> pd.DataFrame:
+    """
+    Return a wide report as one row per id and resource, with columns
+    *id_columns, 'resource' and 'value', so that new GPU types add rows
+    rather than columns.
+    """
+    id_columns = list(id_columns)
+    resources = [c for c in df.columns if c not in id_columns]
+    long = df.melt(id_vars=id_columns, value_vars=resources, var_name="resource", value_name="value")
+    long["resource"] = pd.Categorical(long["resource"], categories=resources)
+    return long
+
+def _typed(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return df with its string columns as categoricals and its integer columns
+    as int64, so that every month partition of a dataset has the same schema
+    whatever the range of the narrow counts of the job table in that month.
+    """
+    columns = {
+        col: df[col].astype("category")
+        for col in df.columns
+        if df[col].dtype == object and col not in _STRING_COLUMNS
+    }
+    columns.update({
+        col: df[col].astype("int64")
+        for col in df.columns
+        if pd.api.types.is_integer_dtype(df[col]) and df[col].dtype != "int64"
+    })
+    return df.assign(**columns) if columns else df
+
+def _month_labels(times: pd.Series) -> pd.Series:
+    """Return 'YYYY-MM' for each time as a categorical, NaN where the time is missing."""
+    times = pd.to_datetime(times)
+    codes = (times.dt.year * 100 + times.dt.month).astype("Int64")
+    labels = {code: f"{code // 100:04d}-{code % 100:02d}" for code in codes.dropna().unique()}
+    return codes.map(labels).astype("category")
+
+def _write_table(table: pa.Table, path: Path, output_format: str) -> None:
+    if output_format == "parquet":
+        pq.write_table(table, path, compression=_COMPRESSION)
+    else:
+        feather.write_feather(table, path, compression=_COMPRESSION)
+
+def _clear_dataset(root: Path) -> None:
+    """
+    Remove the month partitions of an earlier run in any format, so that a
+    dataset never mixes formats, leaving anything else in place.
+    """
+    for part in root.glob("month=*/part-*"):
+        part.unlink()
+        if not any(part.parent.iterdir()):
+            part.parent.rmdir()
+
+def write_report(df: pd.DataFrame, output_dir, name: str, output_format: str = "csv",
+                 time_column: str | None = None) -> Path:
+    """
+    Write a report in the given format and return the file or dataset path.
+    Columnar reports with a time_column are partitioned by its month; rows
+    without a time go to the month=__HIVE_DEFAULT_PARTITION__ partition.
+    """
+    output_dir = Path(output_dir)
+    if output_format == "csv":
+        path = output_dir / f"{name}.csv"
+        df.to_csv(path, sep=",", index=False)
+        return path
+
+    df = _typed(df)
+    if time_column is None:
+        path = output_dir / f"{name}.{output_format}"
+        _write_table(pa.Table.from_pandas(df, preserve_index=False), path, output_format)
+        return path
+
+    root = output_dir / name
+    root.mkdir(exist_ok=True)
+    _clear_dataset(root)
+    months = _month_labels(df[time_column])
+    for month, rows in df.groupby(months.cat.add_categories("__HIVE_DEFAULT_PARTITION__")
+                                  .fillna("__HIVE_DEFAULT_PARTITION__"), observed=True, sort=True):
+        part_dir = root / f"month={month}"
+        part_dir.mkdir(exist_ok=True)
+        table = pa.Table.from_pandas(rows, preserve_index=False)
+        _write_table(table, part_dir / f"part-0.{output_format}", output_format)
+    return root
@@ -0,0 +1,169 @@
+"""
+Per-stage instrumentation for a reporting run.
+
+A Profiler records, for each named stage of main.main:
+
+- wall time and CPU time (including worker processes reaped during the stage)
+- peak RSS during the stage; on Linux the high-water mark is reset at the
+  start of each stage, elsewhere the process peak so far is reported
+- input and output row counts
+- the number of distinct partitions, nodes and users in the stage output
+
+Stages listed in cprofile_stages are additionally run under cProfile and
+dumped as profile_<stage>.prof, readable with pstats or snakeviz.
+A disabled Profiler does nothing, so stages can be wrapped unconditionally.
+"""
+
+import cProfile
+import datetime
+import json
+import os
+import platform
+import resource
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+from src.utils import encode_nodelists
+
+PROFILE_FILE = "Profile.json"
+
+_PROC_STATUS = Path("/proc/self/status")
+_PROC_CLEAR_REFS = Path("/proc/self/clear_refs")
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the process RSS high-water mark (Linux only); return whether it worked."""
+    try:
+        _PROC_CLEAR_REFS.write_text("5")
+        return True
+    except OSError:
+        return False
+
+def _peak_rss_mb(since_reset: bool) -> float:
+    """Return the peak RSS in MB, since the last reset when since_reset is set."""
+    if since_reset:
+        for line in _PROC_STATUS.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _distinct(df: pd.DataFrame, *columns) -> int | None:
+    """Return the number of distinct values in the first non-numeric column of columns present in df."""
+    for col in columns:
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
+            values = df[col].dropna()
+            if col.lower() == "nodelist":
+                # Slurm hostlists are counted by the nodes they expand to
+                values = pd.Series(encode_nodelists(values)[2])
+            return int(values[values != "None assigned"].nunique())
+    return None
+
+def describe_frame(df) -> dict:
+    """Return the output row count and distinct partition, node and user counts of a stage result."""
+    if not isinstance(df, pd.DataFrame):
+        return {"rows_out": None if df is None else len(df)}
+    return {
+        "rows_out": len(df),
+        "partitions": _distinct(df, "partition", "Partition"),
+        # sacct frames also have a numeric 'node' column holding node counts
+        "nodes": _distinct(df, "nodelist", "NodeList", "node"),
+        "users": _distinct(df, "user", "User"),
+    }
+
+def count_data_lines(path) -> int:
+    """Return the number of data rows (lines after the header) in a file or the files of a directory."""
+    path = Path(path)
+    files = sorted(path.glob("JobList_*.txt")) if path.is_dir() else [path]
+    total = 0
+    for file in files:
+        with open(file, "rb") as f:
+            lines = sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b""))
+        total += max(lines - 1, 0)
+    return total
+
+
+class Stage:
+    """Measurements of one stage; call output() with the stage result to record its size."""
+
+    def __init__(self, name: str, rows_in: int | None):
+        self.name = name
+        self.rows_in = rows_in
+        self.result = None
+
+    def output(self, result):
+        self.result = result
+        return result
+
+
+class Profiler:
+    """Collect per-stage measurements and write them as JSON."""
+
+    def __init__(self, enabled: bool = False, cprofile_stages=(), output_dir="."):
+        self.enabled = enabled
+        self.cprofile_stages = set(cprofile_stages)
+        self.output_dir = Path(output_dir)
+        self.started = datetime.datetime.now()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int | None = None):
+        stage = Stage(name, rows_in)
+        if not self.enabled:
+            yield stage
+            return
+
+        reset = _reset_peak_rss()
+        profile = cProfile.Profile() if name in self.cprofile_stages else None
+        children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        times_before = os.times()
+        wall_start = time.perf_counter()
+        if profile:
+            profile.enable()
+        try:
+            yield stage
+        finally:
+            if profile:
+                profile.disable()
+            wall = time.perf_counter() - wall_start
+            times_after = os.times()
+            children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+            cpu = sum(after - before for after, before in zip(times_after[:4], times_before[:4]))
+            record = {
+                "stage": name,
+                "wall_seconds": round(wall, 4),
+                "cpu_seconds": round(cpu, 4),
+                "peak_rss_mb": round(_peak_rss_mb(reset), 1),
+                "peak_rss_scope": "stage" if reset else "process",
+                "rows_in": rows_in,
+                **describe_frame(stage.result),
+            }
+            if children_after.ru_utime + children_after.ru_stime > children_before.ru_utime + children_before.ru_stime:
+                # ru_maxrss of children is the largest worker seen so far
+                record["workers_peak_rss_mb"] = round(children_after.ru_maxrss / 1024, 1)
+            if profile:
+                profile_path = self.output_dir / f"profile_{name}.prof"
+                profile.dump_stats(profile_path)
+                record["cprofile"] = str(profile_path)
+            self.stages.append(record)
+
+    def write(self, run_info: dict | None = None) -> Path | None:
+        """Write the collected measurements to PROFILE_FILE in the output directory."""
+        if not self.enabled:
+            return None
+        report = {
+            "started": self.started.isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "run": run_info or {},
+            "total_wall_seconds": round(sum(s["wall_seconds"] for s in self.stages), 4),
+            "total_cpu_seconds": round(sum(s["cpu_seconds"] for s in self.stages), 4),
+            "stages": self.stages,
+        }
+        path = self.output_dir / PROFILE_FILE
+        path.write_text(json.dumps(report, indent=2, default=str))
+        return path
@@ -0,0 +1,135 @@
+"""
+Ingesting jobs by running sacct directly, without JobList files.
+
+The report window is split into month or week windows and sacct is run once
+per window with the fields described in the README, in a process pool of at
+most `concurrency` queries. Each query's stdout is parsed as it streams in,
+so the log never exists as a file or as one string in memory. Windows are
+merged newest first, exactly like a directory of monthly logs.
+
+With save_dir, each window's raw output is also written to
+JobList_<window>.txt as it is read, so later runs can use --jobs-dir.
+"""
+
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+from src.jobs import SACCT_TIME_FORMAT, load_sacct_file, merge_sacct_data
+
+SACCT_FIELDS = "jobid,user,partition,submit,start,end,state,elapsedraw,nodelist,reqtres,alloctres"
+
+# Window lengths as offset aliases, and the date format of their JobList names
+SACCT_WINDOWS = {"month": ("MS", "%Y-%m"), "week": ("W-MON", "%Y-%m-%d")}
+
+
+class _Tee:
+    """File-like wrapper that copies everything read from a stream into a file."""
+
+    def __init__(self, stream, copy):
+        self.stream = stream
+        self.copy = copy
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.copy.write(data)
+        return data
+
+    def __iter__(self):
+        for line in self.stream:
+            self.copy.write(line)
+            yield line
+
+def sacct_windows(start, end, window: str = "month") -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+    """Split [start, end) into windows aligned to months or weeks (Mondays), newest first."""
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    inner = pd.date_range(start=start, end=end, freq=SACCT_WINDOWS[window][0], inclusive="neither")
+    edges = [start, *inner, end]
+    return [(a, b) for a, b in zip(edges[:-1], edges[1:]) if a < b][::-1]
+
+def sacct_command(sacct_path: str, start, end) -> list[str]:
+    """Return the sacct command for all jobs active in [start, end)."""
+    return [
+        sacct_path, "-a", "-P", "-X",
+        f"--starttime={pd.Timestamp(start).strftime(SACCT_TIME_FORMAT)}",
+        f"--endtime={pd.Timestamp(end).strftime(SACCT_TIME_FORMAT)}",
+        "-o", SACCT_FIELDS,
+    ]
+
+def window_log_name(start, window: str = "month") -> str:
+    return f"JobList_{pd.Timestamp(start).strftime(SACCT_WINDOWS[window][1])}.txt"
+
+def fetch_sacct_window(sacct_path: str, start, end, capacities, chunk_rows=None,
+                       save_path=None) -> pd.DataFrame | None:
+    """
+    Run sacct for one window and return its preprocessed jobs, or None if it
+    returned no jobs. Raises RuntimeError if sacct fails.
+    """
+    cmd = sacct_command(sacct_path, start, end)
+    # stderr goes to a file so that a chatty sacct cannot block on a full pipe
+    with tempfile.TemporaryFile("w+") as stderr, \
+            subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, text=True) as proc:
+        copy = open(Path(save_path).with_suffix(".tmp"), "w") if save_path else None
+        try:
+            stream = _Tee(proc.stdout, copy) if copy else proc.stdout
+            try:
+                df = load_sacct_file(stream, capacities, chunk_rows=chunk_rows)
+            except pd.errors.EmptyDataError:
+                df = None
+            # drain anything the parser did not read so that sacct can exit
+            for _ in stream:
+                pass
+        finally:
+            if copy:
+                copy.close()
+        proc.wait()
+        stderr.seek(0)
+        message = stderr.read().strip()
+
+    if proc.returncode != 0:
+        if save_path:
+            Path(save_path).with_suffix(".tmp").unlink(missing_ok=True)
+        raise RuntimeError(f"{' '.join(cmd)} failed with exit code {proc.returncode}: {message}")
+    if save_path:
+        Path(save_path).with_suffix(".tmp").replace(save_path)
+    if df is None or df.empty:
+        return None
+    return df
+
+def _fetch_window_table(sacct_path, start, end, capacities, chunk_rows, save_path) -> pa.Table | None:
+    """Worker entry point: fetch one window as an Arrow table for cheap transfer."""
+    df = fetch_sacct_window(sacct_path, start, end, capacities, chunk_rows, save_path)
+    return None if df is None else pa.Table.from_pandas(df, preserve_index=False)
+
+def fetch_sacct_data(report_start, report_end, capacities, sacct_path: str = "sacct", window: str = "month",
+                     concurrency: int = 1, chunk_rows=None, save_dir=None) -> pd.DataFrame:
+    """
+    Return the compact job table for [report_start, report_end) straight from
+    sacct. With concurrency > 1, windows are queried and parsed in a process pool.
+    """
+    windows = sacct_windows(report_start, report_end, window)
+    if not windows:
+        raise ValueError("The report window is empty; there is nothing to fetch from sacct")
+    save_paths = [Path(save_dir) / window_log_name(start, window) if save_dir else None for start, _ in windows]
+
+    if concurrency > 1:
+        with ProcessPoolExecutor(max_workers=min(concurrency, len(windows))) as pool:
+            futures = [
+                pool.submit(_fetch_window_table, sacct_path, start, end, capacities, chunk_rows, save_path)
+                for (start, end), save_path in zip(windows, save_paths)
+            ]
+            tables = (future.result() for future in futures)
+            frames = [table.to_pandas() for table in tables if table is not None]
+    else:
+        frames = [
+            df for (start, end), save_path in zip(windows, save_paths)
+            if (df := fetch_sacct_window(sacct_path, start, end, capacities, chunk_rows, save_path)) is not None
+        ]
+
+    if not frames:
+        raise ValueError(f"sacct returned no jobs between {report_start} and {report_end}")
+    return merge_sacct_data(frames)
@@ -0,0 +1,389 @@
+"""
+A long-running report server over local HTTP or a Unix socket (serve.py).
+
+The job table and capacity history are loaded once and kept in memory, and
+queries for any window are answered from them:
+
+    GET  /utilisation?start=2025-03-04&end=2025-03-05&freq=h&partition=gpu*&group_by=user
+    GET  /usage?start=2025-03-01&end=2025-04-01&period=day
+    GET  /jobs?start=2025-03-04&end=2025-03-05
+    GET  /capacity?start=2025-03-01&end=2025-04-01&intervals=1
+    GET  /status
+    POST /refresh
+
+Responses are CSV with the columns of the matching report, or JSON with
+format=json. Computed results are kept in an LRU cache keyed by the query
+and the version of the job store, so a refresh never serves stale results.
+
+The store polls its directories. New JobList_*.txt logs that are newer than
+every loaded log are preprocessed on their own and merged in front of the
+table, as a full merge would order them; any other change (a changed,
+removed or backfilled log, or new capacity files) reloads everything, which
+is cheap with the preprocessing cache.
+"""
+
+import json
+import os
+import socketserver
+import sys
+import threading
+from collections import OrderedDict
+from fnmatch import fnmatch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from src.cache import DEFAULT_MAX_CACHE_BYTES
+from src.capacities import expand_capacity_intervals, expand_capacity_snapshots, get_capacities, get_capacity_history
+from src.capacity_store import capacity_store_dir, update_capacity_store
+from src.capacity_helpers import get_gpu_types
+from src.incremental import file_signature
+from src.jobs import JOB_REPORT_COLUMNS, get_sacct_data, list_sacct_files, merge_sacct_data, window_jobs
+from src.output import to_long_layout
+from src.timeseries import AGGREGATE_FREQS, make_sacct_timeseries_fast, make_sacct_timeseries_grouped, make_sacct_usage
+
+DEFAULT_RESULT_CACHE_ENTRIES = 64
+
+_CAPACITY_GLOB = "capacities-*.txt"
+
+
+class QueryError(ValueError):
+    """A query with missing or invalid parameters, answered with 400."""
+
+
+def _signatures(paths) -> dict:
+    return {str(Path(p).resolve()): file_signature(p) for p in paths}
+
+
+class JobStore:
+    """The job table and capacity history of a jobs directory, refreshed in place."""
+
+    def __init__(self, jobs_dir, capacities_dir=None, cache_dir=None, max_cache_bytes=DEFAULT_MAX_CACHE_BYTES,
+                 workers=1, chunk_rows=None):
+        self.jobs_dir = Path(jobs_dir)
+        self.capacities_dir = Path(capacities_dir) if capacities_dir else None
+        self.load_options = {"cache_dir": cache_dir, "max_cache_bytes": max_cache_bytes,
+                             "workers": workers, "chunk_rows": chunk_rows}
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.version = 0
+        self.files = {}
+        self.capacity_files = {}
+        self.jobs = None
+        self.capacities = None
+        self.resources = []
+        self.loaded_at = None
+        self.refresh()
+
+    def _load_capacities(self) -> pd.DataFrame:
+        """Return the capacity history, or the current sinfo capacities without a capacities directory."""
+        cache_dir = self.load_options["cache_dir"]
+        store = capacity_store_dir(cache_dir) if cache_dir else None
+        history = pd.DataFrame()
+        if self.capacities_dir:
+            history = update_capacity_store(store, self.capacities_dir) if store \
+                else get_capacity_history(self.capacities_dir)
+        return get_capacities(store) if history.empty else history
+
+    def refresh(self) -> bool:
+        """Pick up new or changed logs and capacity files. Returns whether the store changed."""
+        # only one refresh runs at a time; the state lock is taken just to swap in
+        # the new state, so queries keep being answered during a reload
+        with self.refresh_lock:
+            files = _signatures(list_sacct_files(self.jobs_dir))
+            capacity_files = _signatures(sorted(self.capacities_dir.glob(_CAPACITY_GLOB))) \
+                if self.capacities_dir else {}
+            if self.jobs is not None and files == self.files and capacity_files == self.capacity_files:
+                return False
+
+            new = sorted((Path(p) for p in files.keys() - self.files.keys()), key=lambda p: p.name)
+            appended = (
+                new
+                and self.jobs is not None
+                and capacity_files == self.capacity_files
+                and all(files.get(p) == sig for p, sig in self.files.items())
+                and new[0].name > max(Path(p).name for p in self.files)
+            )
+            capacities, resources = self.capacities, self.resources
+            if appended:
+                new_jobs = get_sacct_data(self.jobs_dir, capacities, files=new, **self.load_options)
+                jobs = merge_sacct_data([new_jobs, self.jobs])
+            else:
+                if capacity_files != self.capacity_files or capacities is None:
+                    capacities = self._load_capacities()
+                    resources = ["cpu", "mem_gb"] + get_gpu_types(capacities) + ["indeterminate_gpu"]
+                jobs = get_sacct_data(self.jobs_dir, capacities, **self.load_options)
+
+            with self.lock:
+                self.jobs, self.capacities, self.resources = jobs, capacities, resources
+                self.files, self.capacity_files = files, capacity_files
+                self.version += 1
+                self.loaded_at = pd.Timestamp.now().floor("s")
+            return True
+
+    def snapshot(self) -> tuple:
+        """Return (version, jobs, capacities, resources) as one consistent state."""
+        with self.lock:
+            return self.version, self.jobs, self.capacities, self.resources
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                "version": self.version,
+                "loaded_at": str(self.loaded_at),
+                "jobs": len(self.jobs),
+                "logs": len(self.files),
+                "capacity_files": len(self.capacity_files),
+                "resources": self.resources,
+            }
+
+
+class ResultCache:
+    """Thread-safe LRU cache of query results."""
+
+    def __init__(self, max_entries: int = DEFAULT_RESULT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, compute):
+        """Return the cached result for key, computing and storing it on a miss."""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        # computed outside the lock so that slow queries do not block cached ones
+        result = compute()
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return result
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses}
+
+
+def _param(params: dict, name: str, default=None, required=False):
+    values = params.get(name)
+    if not values:
+        if required:
+            raise QueryError(f"Missing parameter '{name}'")
+        return default
+    return values[-1]
+
+def _list_param(params: dict, name: str) -> list[str]:
+    """Return a comma-separated parameter, which may also be repeated, as a list."""
+    return [v for value in params.get(name, []) for v in value.split(",") if v]
+
+def _window(params: dict) -> tuple[pd.Timestamp, pd.Timestamp]:
+    """Return the [start, end) window of a query given as dates or date-times."""
+    start, end = _param(params, "start", required=True), _param(params, "end", required=True)
+    try:
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+    except ValueError as e:
+        raise QueryError(f"Invalid start or end: {e}") from None
+    if start >= end:
+        raise QueryError("start must be before end")
+    return start, end
+
+def _freq(params: dict) -> str:
+    freq = _param(params, "freq", "h")
+    try:
+        pd.tseries.frequencies.to_offset(freq)
+    except ValueError:
+        raise QueryError(f"freq is not a valid pandas frequency: '{freq}'") from None
+    return freq
+
+def select_partitions(jobs: pd.DataFrame, patterns) -> pd.DataFrame:
+    """Return the jobs in partitions matching any of the shell-style patterns (all jobs without patterns)."""
+    if not patterns:
+        return jobs
+    names = [p for p in pd.unique(jobs["partition"].dropna()) if any(fnmatch(p, pattern) for pattern in patterns)]
+    return jobs[jobs["partition"].isin(names)]
+
+
+class ReportService:
+    """Answers report queries from a JobStore, caching the results."""
+
+    def __init__(self, store: JobStore, cache: ResultCache):
+        self.store = store
+        self.cache = cache
+        self.queries = {
+            "/utilisation": self.utilisation,
+            "/usage": self.usage,
+            "/jobs": self.jobs,
+            "/capacity": self.capacity,
+        }
+
+    def query(self, path: str, params: dict) -> pd.DataFrame:
+        """Return the result of a query path (one of self.queries), raising QueryError for bad parameters."""
+        handler = self.queries[path]
+        version, jobs, capacities, resources = self.store.snapshot()
+        # the key holds the parsed parameters, so equivalent spellings share an entry
+        key, compute = handler(params, jobs, capacities, resources)
+        return self.cache.get((version, path, key), compute)
+
+    def utilisation(self, params, jobs, capacities, resources):
+        start, end = _window(params)
+        freq = _freq(params)
+        partitions = _list_param(params, "partition")
+        group_by = _list_param(params, "group_by")
+        layout = _param(params, "layout", "wide")
+        missing = [key for key in group_by if key not in jobs.columns]
+        if missing:
+            raise QueryError(f"group_by columns not in the job table: {', '.join(missing)}")
+        if layout not in ("wide", "long"):
+            raise QueryError("layout must be 'wide' or 'long'")
+
+        def compute():
+            selected = window_jobs(select_partitions(jobs, partitions), (start, end))
+            if group_by:
+                return make_sacct_timeseries_grouped(selected, resources, start, end, freq=freq, by=group_by)
+            result = make_sacct_timeseries_fast(selected, resources, start, end, freq=freq)
+            return to_long_layout(result, ["snapshot time", "partition"]) if layout == "long" else result
+        return (start, end, freq, tuple(partitions), tuple(group_by), layout), compute
+
+    def usage(self, params, jobs, capacities, resources):
+        start, end = _window(params)
+        period = _param(params, "period", "day")
+        partitions = _list_param(params, "partition")
+        if period not in AGGREGATE_FREQS:
+            raise QueryError(f"period must be one of {', '.join(AGGREGATE_FREQS)}")
+
+        def compute():
+            selected = window_jobs(select_partitions(jobs, partitions), (start, end))
+            freq = AGGREGATE_FREQS[period]
+            return make_sacct_usage(selected, resources, start, end, [freq])[freq]
+        return (start, end, period, tuple(partitions)), compute
+
+    def jobs(self, params, jobs, capacities, resources):
+        start, end = _window(params)
+        partitions = _list_param(params, "partition")
+
+        def compute():
+            selected = window_jobs(select_partitions(jobs, partitions), (start, end))
+            columns = JOB_REPORT_COLUMNS + resources[2:]
+            return selected[columns].reset_index(drop=True)
+        return (start, end, tuple(partitions)), compute
+
+    def capacity(self, params, jobs, capacities, resources):
+        start, end = _window(params)
+        intervals = _param(params, "intervals", "0") not in ("0", "false", "")
+
+        def compute():
+            if "date" not in capacities.columns:
+                # current sinfo capacities have no history to expand
+                return capacities
+            if intervals:
+                return expand_capacity_intervals(capacities, start=start, end=end)
+            return expand_capacity_snapshots(capacities, start=start, end=end)
+        return (start, end, intervals), compute
+
+    def status(self) -> dict:
+        return {**self.store.status(), "result_cache": self.cache.stats()}
+
+
+def _encode(df: pd.DataFrame, output_format: str) -> tuple[bytes, str]:
+    if output_format == "json":
+        return df.to_json(orient="records", date_format="iso").encode(), "application/json"
+    return df.to_csv(index=False).encode(), "text/csv; charset=utf-8"
+
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end of a ReportService, which the server holds as .service."""
+
+    server_version = "hpc-utilisation-reporter"
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "local"
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, obj) -> None:
+        self._send(status, json.dumps(obj, default=str).encode(), "application/json")
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        service = self.server.service
+        if url.path == "/status":
+            return self._send_json(200, service.status())
+        if url.path not in service.queries:
+            return self._send_json(404, {"error": f"Unknown query {url.path}"})
+        output_format = _param(params, "format", "csv")
+        try:
+            if output_format not in ("csv", "json"):
+                raise QueryError("format must be 'csv' or 'json'")
+            body, content_type = _encode(service.query(url.path, params), output_format)
+        except QueryError as e:
+            return self._send_json(400, {"error": str(e)})
+        except Exception as e:  # answer the client rather than dropping the connection
+            self.log_error("Query %s failed: %r", self.path, e)
+            return self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+        self._send(200, body, content_type)
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/refresh":
+            return self._send_json(404, {"error": f"Unknown action {self.path}"})
+        try:
+            changed = self.server.service.store.refresh()
+        except Exception as e:  # the store keeps its last good state
+            self.log_error("Refresh failed: %r", e)
+            return self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+        self._send_json(200, {"changed": changed, **self.server.service.status()})
+
+
+class UnixReportServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service: ReportService, host="127.0.0.1", port=8765, socket_path=None):
+    """Return a threading HTTP server for service on host:port, or on a Unix socket."""
+    if socket_path:
+        server = UnixReportServer(str(socket_path), ReportRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), ReportRequestHandler)
+    server.service = service
+    return server
+
+def poll(store: JobStore, interval: float, stop: threading.Event) -> None:
+    """Refresh the store every interval seconds until stop is set, reporting failures to stderr."""
+    while not stop.wait(interval):
+        try:
+            if store.refresh():
+                print(f"Reloaded: {store.status()}", file=sys.stderr)
+        except Exception as e:  # keep serving the last good state
+            print(f"Refresh failed: {e}", file=sys.stderr)
+
+def serve(service: ReportService, host="127.0.0.1", port=8765, socket_path=None, poll_seconds=60.0) -> None:
+    """Serve until interrupted, polling the store for new logs in a background thread."""
+    server = make_server(service, host, port, socket_path)
+    stop = threading.Event()
+    if poll_seconds > 0:
+        threading.Thread(target=poll, args=(service.store, poll_seconds, stop), daemon=True).start()
+    print(f"Serving on {socket_path or f'http://{host}:{server.server_address[1]}'}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+        if socket_path:
+            os.unlink(socket_path)
@@ -1,5 +1,19 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
 import pandas as pd
 
+from src.capacities import CLUSTER_PARTITION
+
+# Running jobs (no End) are treated as ending at this time
+OPEN_END = pd.Timestamp("2100-01-01T00:00:00")
+
+# Float resources are accumulated exactly as integers split into limbs of
+# this many bits, so that running totals never drift and sums of up to 2**32
+# jobs cannot overflow int64
+_LIMB_BITS = 31
+
 def make_sacct_timeseries(preprocessed_sacct_data, ts_res_list, report_starttime, report_endtime, freq):
     jobs = preprocessed_sacct_data.dropna(subset=['start']).copy()
     jobs.loc[:, "end"] = jobs["end"].fillna(pd.Timestamp("2100-01-01T00:00:00"))    
@@ -23,66 +37,411 @@ def make_sacct_timeseries(preprocessed_sacct_data, ts_res_list, report_starttime
 
     return pd.concat(partition_util_list, ignore_index=True)
 
-"""
+def _float_limbs(col: np.ndarray):
+    """
+    Split floats into exact integer limbs: col * 2**shift
+    == sum(limbs[:, j] << (_LIMB_BITS * j)). Returns the limbs and shift.
+    """
+    mantissas, exponents = np.frexp(col)
+    nonzero = col != 0
+    if not nonzero.any():
+        return np.zeros((len(col), 1), dtype=np.int64), 0
 
-def make_sacct_timeseries_fast(preprocessed_sacct_data, ts_res_list,
-                               report_starttime, report_endtime, freq,
-                               aggregate=None):
-    jobs = preprocessed_sacct_data.dropna(subset=['start']).copy()
-    jobs["end"] = jobs["end"].fillna(pd.Timestamp("2100-01-01T00:00:00"))
+    # col * 2**shift is an integer when shift covers the lowest set mantissa bit
+    ints = np.ldexp(mantissas[nonzero], 53).astype(np.int64)
+    trailing = np.log2(ints & -ints).astype(np.int64)
+    shift = max(0, int((53 - exponents[nonzero] - trailing).max()))
+    bits = int(exponents[nonzero].max()) + shift
+    n_limbs = max(1, -(-bits // _LIMB_BITS))
 
-    # Build event list
-    events = []
-    for _, row in jobs.iterrows():
-        for resource in ts_res_list:
-            events.append((row['start'], row['partition'], resource, row[resource]))
-            events.append((row['end'], row['partition'], resource, -row[resource]))
-
-    events_df = pd.DataFrame(events, columns=['time','partition','resource','delta'])
-    events_df = events_df.sort_values('time')
-
-    # Pivot to wide format and cumulative sum
-    util = (
-        events_df.pivot_table(index=['time','partition'],
-                              columns='resource',
-                              values='delta',
-                              aggfunc='sum')
-        .fillna(0)
-        .groupby(level='partition')
-        .cumsum()
-    )
-
-        # Explicit hourly grid
-    hourly_grid = pd.date_range(start=report_starttime, end=report_endtime, freq=freq)
-
-    # Build MultiIndex with same order as util.index (time, partition)
-    multi_index = pd.MultiIndex.from_product(
-        [hourly_grid, util.index.levels[1]], names=["time", "partition"]
-    )
-
-    util_resampled = (
-        util.reindex(multi_index)
-            .groupby("partition")
-            .ffill()
-            .reset_index()
-    )
-    
-    # Optional aggregation
-    if aggregate == "daily":
-        util_resampled["date"] = util_resampled["time"].dt.date
-        util_resampled = (
-            util_resampled.groupby(["partition","date"])
-                          .mean()
-                          .reset_index()
-        )
-    elif aggregate == "weekly":
-        util_resampled["week"] = util_resampled["time"].dt.to_period("W").apply(lambda r: r.start_time)
-        util_resampled = (
-            util_resampled.groupby(["partition","week"])
-                          .mean()
-                          .reset_index()
-        )
-
-    return util_resampled
-
-"""
+    limbs = np.zeros((len(col), n_limbs), dtype=np.int64)
+    # floor(col * 2**(shift - LIMB_BITS * j)) is exact, and so are the limb differences
+    upper = np.zeros(len(col))
+    for j in reversed(range(n_limbs)):
+        scaled = np.floor(np.ldexp(col, shift - _LIMB_BITS * j))
+        limbs[:, j] = scaled - np.ldexp(upper, _LIMB_BITS)
+        upper = scaled
+    return limbs, shift
+
+def _resource_matrix(jobs, ts_res_list):
+    """
+    Return job resources as an int64 matrix plus, per resource, its columns in
+    the matrix and the binary shift of a float resource (None for integers).
+    """
+    blocks, layout, width = [], [], 0
+    for resource in ts_res_list:
+        col = pd.to_numeric(jobs[resource]).fillna(0)
+        if pd.api.types.is_integer_dtype(col):
+            block, shift = col.to_numpy(dtype=np.int64).reshape(-1, 1), None
+        else:
+            block, shift = _float_limbs(col.to_numpy(dtype=np.float64))
+        blocks.append(block)
+        layout.append((slice(width, width + block.shape[1]), shift))
+        width += block.shape[1]
+
+    values = np.hstack(blocks) if blocks else np.zeros((len(jobs), 0), dtype=np.int64)
+    return values, layout
+
+def _decode(totals: np.ndarray, columns: slice, shift) -> np.ndarray:
+    """
+    Return one resource from summed matrix columns: the integers as they are,
+    floats as the exact limb sums rounded once to the nearest float64.
+    """
+    if shift is None:
+        return totals[..., columns.start]
+    limbs = totals[..., columns]
+    exact = limbs[..., -1].astype(object)
+    for j in reversed(range(limbs.shape[-1] - 1)):
+        exact = (exact << _LIMB_BITS) + limbs[..., j].astype(object)
+    # int / int is correctly rounded in Python, however large the integers
+    return (exact / (1 << shift)).astype(np.float64)
+
+def _sweep(starts, ends, values, grid):
+    """
+    Sum values over intervals with start <= t <= end at each grid time t.
+    Computed as (sum of jobs started by t) - (sum of jobs ended before t).
+    """
+    start_order = np.argsort(starts, kind="stable")
+    end_order = np.argsort(ends, kind="stable")
+
+    zero_row = np.zeros((1, values.shape[1]), dtype=values.dtype)
+    started = np.vstack([zero_row, np.cumsum(values[start_order], axis=0)])
+    ended = np.vstack([zero_row, np.cumsum(values[end_order], axis=0)])
+
+    n_started = np.searchsorted(starts[start_order], grid, side="right")
+    n_ended = np.searchsorted(ends[end_order], grid, side="left")
+
+    return started[n_started] - ended[n_ended]
+
+# Job arrays shared with time-series worker processes, set by _attach_shared
+_SHARED = {}
+
+def _attach_shared(specs):
+    """Pool initializer: map the shared job arrays described by specs into this process."""
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _SHARED[name] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+def _sweep_shard(lo, hi, grid):
+    """Sweep the shared jobs [lo, hi) (one partition) over one window of the snapshot grid."""
+    starts, ends, values = (_SHARED[name][1][lo:hi] for name in ("starts", "ends", "values"))
+    # jobs spanning the window edges overlap it and are included whole
+    overlaps = (starts <= grid[-1]) & (ends >= grid[0])
+    return _sweep(starts[overlaps], ends[overlaps], values[overlaps], grid)
+
+def _share(arrays: dict):
+    """Copy arrays into new shared memory blocks; return the blocks and their specs."""
+    blocks, specs = [], {}
+    for name, array in arrays.items():
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        blocks.append(shm)
+        specs[name] = (shm.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+def _sweep_parallel(starts, ends, values, codes, n_partitions, grid, workers, time_shards=None):
+    """
+    Sweep every partition over the grid in a process pool; return (partitions, snapshots, resources).
+
+    Jobs are sorted by partition and copied once into shared memory, so each
+    task only receives a job slice and a grid window. Tasks are partition x
+    time window shards; results are placed by shard index, so the output
+    does not depend on which worker finishes first.
+    """
+    order = np.argsort(codes, kind="stable")
+    offsets = np.searchsorted(codes[order], np.arange(n_partitions + 1))
+    if time_shards is None:
+        # enough tasks to keep every worker busy when partitions differ in size
+        time_shards = max(1, -(-4 * workers // max(n_partitions, 1)))
+    windows = [w for w in np.array_split(np.arange(len(grid)), time_shards) if len(w)]
+
+    totals = np.zeros((n_partitions, len(grid), values.shape[1]), dtype=np.int64)
+    blocks, specs = _share({"starts": starts[order], "ends": ends[order], "values": values[order]})
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_shared, initargs=(specs,)) as pool:
+            futures = {
+                (code, window[0], window[-1] + 1): pool.submit(
+                    _sweep_shard, offsets[code], offsets[code + 1], grid[window[0]:window[-1] + 1])
+                for code in range(n_partitions) if offsets[code] < offsets[code + 1]
+                for window in windows
+            }
+            for (code, first, stop), future in futures.items():
+                totals[code, first:stop] = future.result()
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+    return totals
+
+def make_sacct_timeseries_fast(preprocessed_sacct_data, ts_res_list, report_starttime, report_endtime, freq,
+                               workers=1, time_shards=None):
+    """
+    Event-sweep equivalent of make_sacct_timeseries.
+
+    Jobs are turned into sorted start/end event arrays per partition, the
+    resources are cumulatively summed along each array and the running totals
+    are sampled at the snapshot grid with searchsorted. A job counts towards a
+    snapshot t when start <= t <= end, exactly as in make_sacct_timeseries.
+
+    With workers > 1 the sweep is sharded by partition and time window across
+    a process pool (see _sweep_parallel); the result is identical.
+    """
+    jobs = preprocessed_sacct_data.dropna(subset=['start'])
+    grid_times = pd.date_range(start=report_starttime, end=report_endtime, freq=freq, inclusive="left")
+    grid = grid_times.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+    starts = jobs["start"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    ends = jobs["end"].fillna(OPEN_END).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    values, layout = _resource_matrix(jobs, ts_res_list)
+
+    # jobs ending before they start never satisfy start <= t <= end
+    valid = starts <= ends
+
+    codes, partitions = pd.factorize(jobs["partition"], use_na_sentinel=False)
+
+    if workers > 1 and len(grid):
+        # jobs without a partition count towards no partition
+        missing = [code for code, partition in enumerate(partitions) if pd.isna(partition)]
+        counted = valid & ~np.isin(codes, missing)
+        totals = _sweep_parallel(starts[counted], ends[counted], values[counted], codes[counted],
+                                 len(partitions), grid, workers, time_shards)
+    else:
+        totals = np.zeros((len(partitions), len(grid), values.shape[1]), dtype=np.int64)
+        for code, partition in enumerate(partitions):
+            if not pd.isna(partition):
+                mask = valid & (codes == code)
+                totals[code] = _sweep(starts[mask], ends[mask], values[mask], grid)
+
+    resource_totals = [_decode(totals, columns, shift) for columns, shift in layout]
+    partition_util_list = []
+    for code, partition in enumerate(partitions):
+        if pd.isna(partition):
+            # label jobs without a partition with their own missing value, as the reference does
+            partition = jobs["partition"].iloc[int(np.argmax(codes == code))]
+        part_util = pd.DataFrame({"snapshot time": grid_times, "partition": partition})
+
+        for resource, resource_total in zip(ts_res_list, resource_totals):
+            part_util[resource] = resource_total[code]
+
+        partition_util_list.append(part_util)
+
+    if not partition_util_list:
+        return pd.DataFrame(columns=["snapshot time", "partition"] + list(ts_res_list))
+
+    return pd.concat(partition_util_list, ignore_index=True)
+
+# Named aggregation periods; weeks start on Monday and months on the 1st
+AGGREGATE_FREQS = {"hour": "h", "day": "D", "week": "W-MON", "month": "MS"}
+
+def _bucket_edges(report_starttime, report_endtime, freq) -> np.ndarray:
+    """Return the bucket edges of freq within the report window, including both window ends."""
+    start, end = pd.Timestamp(report_starttime), pd.Timestamp(report_endtime)
+    inner = pd.date_range(start=start, end=end, freq=freq, inclusive="neither")
+    edges = pd.DatetimeIndex([start]).append(inner).append(pd.DatetimeIndex([end]))
+    return edges.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+def make_sacct_usage(preprocessed_sacct_data, ts_res_list, report_starttime, report_endtime, freqs):
+    """
+    Exact time-weighted usage (resource-hours) per partition and bucket.
+
+    Each job contributes its resources multiplied by the time it overlaps a
+    bucket, so short jobs between snapshot instants are counted too. The usage
+    is integrated once over the union of all bucket edges: a bucket receives
+    the running allocation level at its start times its width, plus each start
+    or end event inside it times the time from the event to the bucket end.
+    Every frequency in freqs is then a sum of consecutive fine buckets.
+
+    Buckets start at report_starttime, at each freq boundary within the
+    window (e.g. midnight, Monday or the 1st of the month) and end at
+    report_endtime, so the first and last buckets may be partial.
+
+    Returns a dict of freq -> DataFrame with columns 'period start',
+    'period end', 'partition' and '<resource>_hours'.
+    """
+    jobs = preprocessed_sacct_data.dropna(subset=['start'])
+    edges_by_freq = {freq: _bucket_edges(report_starttime, report_endtime, freq) for freq in freqs}
+    fine = np.unique(np.concatenate(list(edges_by_freq.values())))
+    window_start, window_end = fine[0], fine[-1]
+    n_buckets = len(fine) - 1
+    columns = [f"{resource}_hours" for resource in ts_res_list]
+
+    if n_buckets == 0:
+        empty = pd.DataFrame(columns=["period start", "period end", "partition"] + columns)
+        return {freq: empty.copy() for freq in freqs}
+
+    # clip every job to the report window; jobs outside it contribute nothing
+    starts = jobs["start"].to_numpy(dtype="datetime64[ns]").view(np.int64).clip(window_start, window_end)
+    ends = jobs["end"].fillna(OPEN_END).to_numpy(dtype="datetime64[ns]").view(np.int64).clip(window_start, window_end)
+    values = np.column_stack([pd.to_numeric(jobs[resource]).fillna(0).to_numpy(dtype=np.float64)
+                              for resource in ts_res_list]).reshape(len(jobs), len(ts_res_list))
+    keep = starts < ends
+
+    codes, partitions = pd.factorize(jobs["partition"], use_na_sentinel=False)
+    codes, values = codes[keep], values[keep]
+
+    # start events add the job's resources and end events remove them
+    times = np.concatenate([starts[keep], ends[keep]])
+    signs = np.concatenate([np.ones(len(codes)), -np.ones(len(codes))])
+    event_codes = np.concatenate([codes, codes])
+    event_values = np.concatenate([values, values])
+
+    bucket = np.searchsorted(fine, times, side="right") - 1
+    in_window = bucket < n_buckets  # events at the window end affect no bucket
+    bucket, signs, event_codes = bucket[in_window], signs[in_window], event_codes[in_window]
+    event_values, times = event_values[in_window], times[in_window]
+    remaining = (fine[bucket + 1] - times) / 1e9
+    flat = event_codes * n_buckets + bucket
+
+    widths = np.diff(fine) / 1e9
+    size = len(partitions) * n_buckets
+    usage = np.zeros((len(partitions), n_buckets, len(ts_res_list)))
+    for i in range(len(ts_res_list)):
+        deltas = np.bincount(flat, weights=signs * event_values[:, i], minlength=size).reshape(-1, n_buckets)
+        partial = np.bincount(flat, weights=signs * event_values[:, i] * remaining, minlength=size)
+        # allocation level at each bucket start is the sum of the deltas before it
+        levels = np.cumsum(deltas, axis=1) - deltas
+        usage[:, :, i] = levels * widths + partial.reshape(-1, n_buckets)
+
+    usage /= 3600
+
+    results = {}
+    for freq, edges in edges_by_freq.items():
+        first_fine = np.searchsorted(fine, edges[:-1])
+        # round away the float noise left in empty buckets by the running sums
+        rolled = np.round(np.add.reduceat(usage, first_fine, axis=1), 6)
+        period_start = pd.to_datetime(np.tile(edges[:-1], len(partitions)))
+        period_end = pd.to_datetime(np.tile(edges[1:], len(partitions)))
+        frame = pd.DataFrame(rolled.reshape(-1, len(ts_res_list)), columns=columns)
+        frame.insert(0, "partition", np.repeat(np.asarray(partitions, dtype=object), len(edges) - 1))
+        frame.insert(0, "period end", period_end)
+        frame.insert(0, "period start", period_start)
+        results[freq] = frame
+
+    return results
+
+def _group_codes(jobs, by):
+    """Return a dense group code per job and a frame of the key values of each group."""
+    if not by:
+        return np.zeros(len(jobs), dtype=np.intp), pd.DataFrame(index=range(1))
+
+    factorized = [pd.factorize(jobs[key], use_na_sentinel=False) for key in by]
+    combined = np.ravel_multi_index([codes for codes, _ in factorized],
+                                    [max(len(uniques), 1) for _, uniques in factorized])
+    _, first, group_codes = np.unique(combined, return_index=True, return_inverse=True)
+    keys = pd.DataFrame({key: uniques.take(codes[first]) for key, (codes, uniques) in zip(by, factorized)})
+    return group_codes, keys
+
+def make_sacct_timeseries_grouped(preprocessed_sacct_data, ts_res_list, report_starttime, report_endtime,
+                                  freq, by):
+    """
+    Sparse long-format allocation time series split by any job columns.
+
+    A job counts towards a snapshot t when start <= t <= end, as in
+    make_sacct_timeseries. Each job becomes two events on the snapshot grid
+    (+resources at its first snapshot, -resources after its last) and the
+    running totals per group are kept as runs of constant allocation, so
+    memory scales with the number of jobs and non-zero cells rather than
+    groups x snapshots. GPU types are separate resources, so a split by GPU
+    type is the 'resource' column.
+
+    Returns columns 'snapshot time', *by, 'resource' and 'value', with one row
+    per non-zero cell, ordered by group, snapshot time and resource. 'value' is
+    int64 when every resource is an integer count and float64 otherwise.
+    """
+    by = list(by)
+    columns = ["snapshot time"] + by + ["resource", "value"]
+    jobs = preprocessed_sacct_data.dropna(subset=['start'])
+    grid_times = pd.date_range(start=report_starttime, end=report_endtime, freq=freq, inclusive="left")
+    grid = grid_times.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+    starts = jobs["start"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    ends = jobs["end"].fillna(OPEN_END).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    # snapshots [first, stop) are the ones with start <= t <= end
+    first = np.searchsorted(grid, starts, side="left")
+    stop = np.searchsorted(grid, ends, side="right")
+    active = first < stop
+
+    group_codes, keys = _group_codes(jobs, by)
+    values, layout = _resource_matrix(jobs, ts_res_list)
+    group_codes, values = group_codes[active], values[active]
+
+    # every job adds its resources at its first snapshot and removes them
+    # after its last, so each group's changes sum to exactly zero
+    event_groups = np.concatenate([group_codes, group_codes])
+    event_snaps = np.concatenate([first[active], stop[active]])
+    event_values = np.concatenate([values, -values])
+
+    # net change per (group, snapshot), ordered by group then snapshot
+    event_keys = event_groups.astype(np.int64) * (len(grid) + 1) + event_snaps
+    order = np.argsort(event_keys, kind="stable")
+    event_keys, event_values = event_keys[order], event_values[order]
+    run_first = np.flatnonzero(np.r_[True, event_keys[1:] != event_keys[:-1]]) if len(order) else order
+    deltas = np.add.reduceat(event_values, run_first, axis=0) if len(order) else event_values
+    run_groups, run_starts = np.divmod(event_keys[run_first], len(grid) + 1)
+
+    # as every group nets to zero, a global running sum is the level within
+    # each group; it holds until the next change, and the last change of a
+    # group always returns it to zero
+    levels = np.cumsum(deltas, axis=0)
+    run_stops = np.append(run_starts[1:], len(grid))[:len(run_starts)]
+
+    parts = []
+    for i, (block, shift) in enumerate(layout):
+        resource_levels = _decode(levels, block, shift)
+        nonzero = resource_levels != 0
+        lengths = (run_stops - run_starts)[nonzero]
+        rows = np.repeat(np.flatnonzero(nonzero), lengths)
+        # snapshot index of each row: run start plus position within the run
+        offsets = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        parts.append((run_groups[rows], run_starts[rows] + offsets,
+                      np.full(len(rows), i), resource_levels[rows]))
+
+    groups, snaps, resources, cell_values = (np.concatenate(p) for p in zip(*parts))
+    order = np.lexsort((resources, snaps, groups))
+    groups, snaps, resources, cell_values = groups[order], snaps[order], resources[order], cell_values[order]
+
+    result = keys.iloc[groups].reset_index(drop=True)
+    result.insert(0, "snapshot time", grid_times[snaps])
+    result["resource"] = pd.Categorical.from_codes(resources, categories=list(ts_res_list))
+    result["value"] = cell_values
+    return result[columns]
+
+def make_utilisation_ratios(time_series_data, capacity_data, resources) -> pd.DataFrame:
+    """
+    Join a utilisation time series (make_sacct_timeseries_fast) with the
+    capacity at the same snapshot times (capacities.capacity_timeseries).
+
+    Returns, per snapshot time and partition, '<resource>_capacity' and
+    '<resource>_ratio' (allocated / capacity, empty where there is no
+    capacity). The CLUSTER_PARTITION rows compare the allocation of all
+    partitions with the capacity of all nodes, each counted once, so they stay
+    exact when nodes are shared between partitions. Partitions follow the
+    order of the time series, then partitions without jobs, then the cluster.
+
+    Both inputs are dense grids, so rows are aligned by position in a
+    [partition, snapshot] array rather than merged.
+    """
+    allocated = time_series_data.dropna(subset=["partition"])
+    names = dict.fromkeys([*allocated["partition"], *capacity_data["partition"]])
+    partitions = pd.Index([p for p in names if p != CLUSTER_PARTITION] + [CLUSTER_PARTITION])
+    grid = np.unique(np.concatenate([allocated["snapshot time"].to_numpy(dtype="datetime64[ns]"),
+                                     capacity_data["snapshot time"].to_numpy(dtype="datetime64[ns]")]))
+
+    def cells(frame):
+        rows = partitions.get_indexer(frame["partition"])
+        return rows, np.searchsorted(grid, frame["snapshot time"].to_numpy(dtype="datetime64[ns]"))
+
+    used_cells, capacity_cells = cells(allocated), cells(capacity_data)
+    ratios = pd.DataFrame({
+        "snapshot time": pd.to_datetime(np.tile(grid, len(partitions))),
+        "partition": np.repeat(np.asarray(partitions, dtype=object), len(grid)),
+    })
+    for resource in resources:
+        used = np.zeros((len(partitions), len(grid)))
+        used[used_cells] = pd.to_numeric(allocated[resource]).to_numpy(dtype=np.float64)
+        used[-1] = used[:-1].sum(axis=0)
+        total = np.zeros((len(partitions), len(grid)))
+        total[capacity_cells] = capacity_data[resource].to_numpy(dtype=np.float64)
+        ratios[f"{resource}_capacity"] = total.ravel()
+        ratios[f"{resource}_ratio"] = np.divide(used, total, out=np.full(total.shape, np.nan), where=total > 0).ravel()
+    return ratios
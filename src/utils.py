@@ -2,11 +2,81 @@
 Utility functions for parsing Slurm‑style strings.
 
 Currently includes:
+- expand_hostlist: expands Slurm hostlists (e.g. 'gpu[01-02],smp[3,5-7]')
+  into node names, memoized across calls.
 - expand_nodelist: expands compact nodelist syntax (e.g. 'node[01-03]')
-  into explicit node names.
+  into a comma-separated string of node names.
+- encode_nodelists / decode_nodelists: convert nodelists to and from a CSR
+  layout (offsets and integer node IDs) over a dense node index.
+- parse_tres: parses TRES strings (AllocTRES / ReqTRES) into typed columns.
 """
 
 import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+_INT_RE = re.compile(r'\d+')
+_MEM_RE = re.compile(r'(\d*\.?\d+)([KMGTP])')
+_GPU_TYPE_PREFIX = "gres/gpu:"
+
+# Memory units are converted to GB; unknown units are left unscaled
+MEM_UNIT_TO_GB = {'K': 1/(1000**2), 'M': 1/1000, 'G': 1, 'T': 1000}
+
+# TRES keys parsed into integer columns, as {tres key: column name}
+_INT_TRES = {"cpu": "cpu", "node": "node", "gres/gpu": "gpu", "billing": "billing"}
+
+def _split_hostlist(hostlist: str) -> list[str]:
+    """Split a hostlist on the commas that are not inside brackets."""
+    exprs, depth, begin = [], 0, 0
+    for pos, char in enumerate(hostlist):
+        if char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+            if depth < 0:
+                raise ValueError(f"Invalid nodelist format: {hostlist}")
+        elif char == ',' and depth == 0:
+            exprs.append(hostlist[begin:pos])
+            begin = pos + 1
+    if depth != 0:
+        raise ValueError(f"Invalid nodelist format: {hostlist}")
+    exprs.append(hostlist[begin:])
+    return [e for e in exprs if e]
+
+def _expand_ranges(ranges: str) -> list[str]:
+    """Expand '01-03,7' into ['01', '02', '03', '7'], keeping the width of each lower bound."""
+    values = []
+    for part in ranges.split(','):
+        lo, _, hi = part.partition('-')
+        if not lo.isdigit() or (hi and not hi.isdigit()):
+            raise ValueError(f"Invalid nodelist range: [{ranges}]")
+        width = len(lo)
+        values.extend(str(i).zfill(width) for i in range(int(lo), int(hi or lo) + 1))
+    return values
+
+def _expand_host_expr(expr: str) -> list[str]:
+    """Expand one host expression, which may hold several bracket groups and suffixes."""
+    open_pos = expr.find('[')
+    if open_pos < 0:
+        return [expr]
+    close_pos = expr.index(']', open_pos)
+    prefix, ranges, rest = expr[:open_pos], expr[open_pos + 1:close_pos], expr[close_pos + 1:]
+    return [prefix + value + tail for value in _expand_ranges(ranges) for tail in _expand_host_expr(rest)]
+
+@lru_cache(maxsize=65536)
+def expand_hostlist(hostlist: str) -> tuple[str, ...]:
+    """
+    Expand a Slurm hostlist into node names, e.g. 'gpu[01-02],smp[3,5-7]' ->
+    ('gpu01', 'gpu02', 'smp3', 'smp5', 'smp6', 'smp7'). Zero-padding is kept,
+    and several groups and suffixes per host ('r[1-2]n[01-02]-ib') are supported.
+    Results are memoized, since the same nodelists repeat throughout a log.
+    """
+    hosts = []
+    for expr in _split_hostlist(hostlist):
+        hosts.extend(_expand_host_expr(expr))
+    return tuple(hosts)
 
 def expand_nodelist(nodelist: str) -> str:
     """Expand SLURM-style nodelist (e.g. 'gpu[1-2]') into full node names."""
@@ -14,22 +84,83 @@ def expand_nodelist(nodelist: str) -> str:
     if not nodelist or '[' not in nodelist:
         return nodelist
 
-    # Extract base name (e.g. node, gpu, smp) and numeric ranges
-    match = re.match(r'(\w+)\[([\d,-]+)\]', nodelist)
-    if not match:
-        raise ValueError("Invalid nodelist format")
+    # Join expanded nodes into a final string
+    return ','.join(expand_hostlist(nodelist))
 
-    base_name, ranges = match.groups()
+def encode_nodelists(nodelists: pd.Series) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Expand nodelist strings into a CSR layout over a dense integer node index.
 
-    # Expand numeric ranges
-    expanded_nodes = []
-    for part in ranges.split(','):
-        if '-' in part:
-            start, end = part.split('-')
-            for i in range(int(start), int(end) + 1):
-                expanded_nodes.append(f"{base_name}{i}")
-        else:
-            expanded_nodes.append(f"{base_name}{part}")
+    Returns (offsets, node_ids, node_names): the nodes of row i are
+    node_names[node_ids[offsets[i]:offsets[i + 1]]]. Each distinct nodelist
+    is expanded only once. Missing nodelists (None or NaN) are both encoded
+    as the node 'nan'.
+    """
+    nodelists = nodelists.astype(object)
+    codes, uniques = pd.factorize(nodelists.where(nodelists.notna(), "nan").astype(str))
+    expanded = [list(expand_hostlist(u)) if u else [u] for u in uniques]
 
-    # Join expanded nodes into a final string
-    return ','.join(expanded_nodes)
+    # dense node index over every node name seen
+    unique_lengths = np.array([len(hosts) for hosts in expanded], dtype=np.int64)
+    flat_codes, node_names = pd.factorize(
+        pd.Series([host for hosts in expanded for host in hosts], dtype=object)
+    )
+    unique_starts = np.cumsum(unique_lengths) - unique_lengths
+
+    lengths = unique_lengths[codes]
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    within_row = np.arange(offsets[-1]) - np.repeat(offsets[:-1], lengths)
+    node_ids = flat_codes[np.repeat(unique_starts[codes], lengths) + within_row].astype(np.int32)
+
+    return offsets, node_ids, np.asarray(node_names, dtype=object)
+
+def decode_nodelists(offsets: np.ndarray, node_ids: np.ndarray, node_names: np.ndarray) -> list[list[str]]:
+    """Return the per-row lists of node names for a CSR nodelist encoding."""
+    names = node_names[node_ids]
+    return [list(names[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)]
+
+def _tokenize_tres(tres: str) -> dict[str, str]:
+    """Split a TRES string into {key: value}, keeping the first value of repeated keys."""
+    fields = {}
+    for token in tres.split(','):
+        key, _, value = token.partition('=')
+        fields.setdefault(key, value)
+    return fields
+
+def _leading_int(value) -> int:
+    match = _INT_RE.match(value) if isinstance(value, str) else None
+    return int(match.group()) if match else 0
+
+def parse_tres(tres: pd.Series) -> pd.DataFrame:
+    """
+    Parse Slurm TRES strings (e.g. 'billing=4,cpu=4,gres/gpu:a100=1,gres/gpu=1,mem=16G,node=1')
+    into typed columns: cpu, node, gpu, billing, mem_gb and one 'gres/gpu:<type>' column
+    per GPU type seen. Missing values are 0.
+
+    Each distinct string is tokenized only once and the results are broadcast
+    back to every row sharing it.
+    """
+    codes, uniques = pd.factorize(tres)
+    parsed = [_tokenize_tres(u) for u in uniques.astype(str)]
+
+    unique_cols = {
+        col: np.array([_leading_int(p.get(key)) for p in parsed], dtype=np.int64)
+        for key, col in _INT_TRES.items()
+    }
+
+    mem = pd.Series([p.get("mem") for p in parsed], dtype=object).str.extract(_MEM_RE)
+    unique_cols["mem_gb"] = (
+        pd.to_numeric(mem[0]).fillna(0).to_numpy()
+        * mem[1].map(MEM_UNIT_TO_GB).fillna(1).to_numpy()
+    )
+
+    gpu_keys = sorted({k for p in parsed for k in p if k.startswith(_GPU_TYPE_PREFIX)})
+    for key in gpu_keys:
+        unique_cols[key] = np.array([_leading_int(p.get(key)) for p in parsed], dtype=np.int64)
+
+    # rows with a missing TRES string have code -1 and take the appended zero
+    columns = {}
+    for col, values in unique_cols.items():
+        values = np.append(values, np.zeros(1, dtype=values.dtype))
+        columns[col] = values[codes]
+    return pd.DataFrame(columns, index=tres.index)
@@ -0,0 +1,24 @@
+import pandas as pd
+
+from src.capacities import expand_capacity_snapshots
+
+
+def test_expanded_snapshots_end_with_date():
+    history = pd.DataFrame({
+        "node": ["n1", "n1", "n2"],
+        "partition": ["cpu", "gpu", "cpu"],
+        "cpu": [64, 64, 32],
+        "mem_gb": [512.0, 512.0, 256.0],
+        "a100": [0, 4, 0],
+        "date": pd.to_datetime(["2025-01-01", "2025-01-02", "2024-12-01"]),
+    })[["date", "node", "partition", "cpu", "mem_gb", "a100"]]
+
+    filled = expand_capacity_snapshots(history, "2025-01-01", "2025-01-04")
+
+    # the CapacityReport.csv header: node, partition, resources and then date
+    assert list(filled.columns) == ["node", "partition", "cpu", "mem_gb", "a100", "date"]
+    assert list(zip(filled["node"], filled["partition"], filled["date"].dt.day)) == [
+        ("n1", "cpu", 1), ("n1", "gpu", 2), ("n1", "gpu", 3),
+        ("n2", "cpu", 1), ("n2", "cpu", 2), ("n2", "cpu", 3),
+    ]
+    assert (filled[["cpu", "mem_gb", "a100"]].dtypes == float).all()
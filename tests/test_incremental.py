@@ -0,0 +1,60 @@
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.generate_workload import generate_workload
+from src.incremental import append_job_report
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+def _report(jobs_dir, capacities_dir, output_dir, start, end, *options):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    subprocess.run(
+        [sys.executable, "main.py", "--jobs-dir", str(jobs_dir), "--capacities-dir", str(capacities_dir),
+         "--output-dir", str(output_dir), "--report-start", start, "--report-end", end, "--no-cache", *options],
+        cwd=REPO, check=True, capture_output=True,
+    )
+
+
+def test_append_matches_full_rebuild(tmp_path):
+    workload = generate_workload(tmp_path / "workload", 3000, months=3)
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    for month in ("2025-01", "2025-02"):
+        shutil.copy2(workload / f"JobList_{month}.txt", logs)
+
+    appended = tmp_path / "appended"
+    _report(logs, workload, appended, "2025-01-01", "2025-03-01", "--checkpoint")
+    shutil.copy2(workload / "JobList_2025-03.txt", logs)
+    _report(logs, workload, appended, "2025-03-01", "2025-04-01", "--append")
+
+    rebuilt = tmp_path / "rebuilt"
+    _report(logs, workload, rebuilt, "2025-01-01", "2025-04-01")
+
+    for report in ("JobReport.csv", "UtilisationReport.csv", "CapacityReport.csv"):
+        assert (appended / report).read_text() == (rebuilt / report).read_text(), report
+    assert not (rebuilt / "ReportCheckpoint.json").exists()
+
+
+def test_append_job_report_parses_quoted_fields(tmp_path):
+    path = tmp_path / "JobReport.csv"
+    path.write_text(
+        "jobid,partition,queue_length_sec\n"
+        '3,"gpu,k2-hipri",10.0\n'
+        '2,"gpu,k2-hipri",\n'
+        "1,cpu,5.0\n"
+    )
+    new = pd.DataFrame({"jobid": ["2", "1"], "partition": ["gpu,k2-hipri", "cpu"], "queue_length_sec": [1.0, 2.0]})
+
+    # job 2 had not started, so only job 1 is reported as superseded
+    assert append_job_report(path, new) == ["1"]
+    assert path.read_text() == (
+        "jobid,partition,queue_length_sec\n"
+        '2,"gpu,k2-hipri",1.0\n'
+        "1,cpu,2.0\n"
+        '3,"gpu,k2-hipri",10.0\n'
+    )
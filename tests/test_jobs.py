@@ -0,0 +1,126 @@
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from benchmarks.generate_workload import generate_workload
+from src import jobs
+from src.capacities import get_capacity_history
+from src.jobs import CATEGORY_COLUMNS, compact_sacct_data, get_sacct_data, merge_sacct_data, stream_sacct_file
+
+
+def _stream_peak(tmp_path, n_jobs, chunk_rows=2000):
+    """Stream a one-month synthetic log; return the peak bytes allocated and the result size."""
+    directory = generate_workload(tmp_path / str(n_jobs), n_jobs, months=1)
+    capacities = get_capacity_history(directory)
+    log = next(directory.glob("JobList_*.txt"))
+
+    tracemalloc.start()
+    df = stream_sacct_file(log, capacities, chunk_rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Arrow buffers are not traced; add the pool's high-water mark, which can only overstate the peak
+    return peak + pa.default_memory_pool().max_memory(), df.memory_usage(deep=True).sum()
+
+
+def test_stream_peak_memory_grows_with_the_result_only(tmp_path):
+    small_peak, small_size = _stream_peak(tmp_path, 10_000)
+    large_peak, large_size = _stream_peak(tmp_path, 40_000)
+
+    # holding every chunk next to the concatenated copy grows the peak by over 3x the result
+    assert large_peak - small_peak < 2.5 * (large_size - small_size)
+
+
+def test_merge_unions_categories_and_fills_missing_gpu_counts():
+    newer = pd.DataFrame({
+        "jobid": ["2", "1"],
+        "partition": pd.Categorical(["gpu", "cpu"]),
+        "gres/gpu:a100": pd.Series([2, 1], dtype="int16"),
+    })
+    older = pd.DataFrame({
+        "jobid": ["1", "0"],
+        "partition": pd.Categorical(["himem", "himem"]),
+    })
+
+    merged = merge_sacct_data(iter([newer, older]))
+
+    assert list(merged["jobid"]) == ["2", "1", "0"]
+    assert isinstance(merged["partition"].dtype, pd.CategoricalDtype)
+    assert list(merged["partition"]) == ["gpu", "cpu", "himem"]
+    assert list(merged["gres/gpu:a100"]) == [2, 1, 0]
+    assert merged["gres/gpu:a100"].dtype == "int16"
+
+
+def test_cached_logs_depend_only_on_the_snapshots_their_jobs_ran_under(tmp_path, monkeypatch):
+    directory = generate_workload(tmp_path / "workload", 3000, months=3)
+    history = get_capacity_history(directory)
+    cache_dir = tmp_path / "cache"
+
+    preprocessed = []
+    preprocess = jobs._preprocess_file
+    monkeypatch.setattr(jobs, "_preprocess_file",
+                        lambda path, *args: preprocessed.append(Path(path).name) or preprocess(path, *args))
+
+    def load(capacities):
+        preprocessed.clear()
+        return get_sacct_data(directory, capacities, cache_dir=cache_dir)
+
+    load(history)
+    assert len(preprocessed) == 3
+
+    # a snapshot after every job started keeps every entry
+    later = history[history["date"] == history["date"].max()].assign(date=pd.Timestamp("2025-06-01"))
+    load(pd.concat([history, later], ignore_index=True))
+    assert preprocessed == []
+
+    # moving a GPU node to another type in February invalidates the logs whose GPU jobs ran since
+    node = history.loc[history["a100"] > 0, "node"].iloc[0]
+    changed = history.copy()
+    feb = (changed["date"] == pd.Timestamp("2025-02-01")) & (changed["node"] == node)
+    changed.loc[feb, ["a100", "h100"]] = [0, 4]
+    df = load(changed)
+    assert sorted(preprocessed) == ["JobList_2025-02.txt", "JobList_2025-03.txt"]
+    pd.testing.assert_frame_equal(df, get_sacct_data(directory, changed))
+
+
+def test_compact_job_table_is_smaller_than_the_uncompacted_frame(tmp_path):
+    directory = generate_workload(tmp_path / "workload", 5000, months=1)
+    df = get_sacct_data(directory, get_capacity_history(directory))
+
+    for col in CATEGORY_COLUMNS:
+        assert isinstance(df[col].dtype, pd.CategoricalDtype), col
+    counts = [col for col in df.columns if pd.api.types.is_integer_dtype(df[col])]
+    assert counts and all(df[col].dtype in (np.int16, np.int32) for col in counts)
+    assert df["submit"].dtype == "datetime64[ns]" and df["mem_gb"].dtype == np.float64
+
+    uncompacted = df.astype({**{col: object for col in CATEGORY_COLUMNS}, **{col: np.int64 for col in counts}})
+    assert df.memory_usage(deep=True).sum() < 0.5 * uncompacted.memory_usage(deep=True).sum()
+    pd.testing.assert_frame_equal(compact_sacct_data(uncompacted), df)
+
+
+def test_counts_fall_back_to_wider_integers():
+    df = compact_sacct_data(pd.DataFrame({
+        "cpu": np.array([1, 32767], dtype=np.int64),
+        "node": np.array([-32768, 40_000], dtype=np.int64),
+        "billing": np.array([0, 2**31], dtype=np.int64),
+        "mem_gb": [1.5, 2.0],
+    }))
+
+    assert df.dtypes.to_dict() == {"cpu": np.int16, "node": np.int32, "billing": np.int64, "mem_gb": np.float64}
+    assert list(df["billing"]) == [0, 2**31]
+
+
+def test_parallel_ingest_merges_worker_tables_like_a_serial_run(tmp_path):
+    directory = generate_workload(tmp_path / "workload", 3000, months=3)
+    capacities = get_capacity_history(directory)
+
+    serial = get_sacct_data(directory, capacities)
+    parallel = get_sacct_data(directory, capacities, workers=2)
+
+    # jobs spanning a month boundary are in two logs; the newest record wins
+    assert serial["jobid"].is_unique
+    pd.testing.assert_frame_equal(parallel, serial)
+    tables = [pa.Table.from_pandas(serial.iloc[::-1], preserve_index=False), serial.iloc[:10]]
+    pd.testing.assert_frame_equal(merge_sacct_data(tables), serial.iloc[::-1].reset_index(drop=True))
@@ -0,0 +1,21 @@
+import pandas as pd
+
+from src.output import write_report
+
+
+def test_rewriting_a_dataset_replaces_parts_of_every_format(tmp_path):
+    report = pd.DataFrame({
+        "snapshot time": pd.to_datetime(["2025-01-01", "2025-02-01"]),
+        "partition": ["gpu", "cpu"],
+        "cpu": [4, 8],
+    })
+    (tmp_path / "Report" / "month=2024-12").mkdir(parents=True)
+    (tmp_path / "Report" / "month=2024-12" / "part-0.feather").write_bytes(b"stale")
+    write_report(report, tmp_path, "Report", "feather", time_column="snapshot time")
+
+    path = write_report(report, tmp_path, "Report", "parquet", time_column="snapshot time")
+
+    assert sorted(p.relative_to(path).as_posix() for p in path.rglob("part-*")) == [
+        "month=2025-01/part-0.parquet", "month=2025-02/part-0.parquet",
+    ]
+    assert list(pd.read_parquet(path)["cpu"]) == [4, 8]
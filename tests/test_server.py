@@ -0,0 +1,82 @@
+import json
+import threading
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+from benchmarks.generate_workload import generate_workload
+from src import server
+from src.server import JobStore, ReportService, ResultCache, make_server
+
+
+@pytest.fixture
+def base_url(tmp_path):
+    directory = generate_workload(tmp_path / "workload", 1000, months=1)
+    service = ReportService(JobStore(directory, directory), ResultCache())
+    httpd = make_server(service, port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _get(url, method="GET"):
+    try:
+        with urlopen(Request(url, method=method)) as response:
+            return response.status, response.read()
+    except HTTPError as e:
+        return e.code, e.read()
+
+
+def test_status_codes(base_url):
+    status, body = _get(f"{base_url}/utilisation?start=2025-01-01&end=2025-01-02&format=json")
+    assert status == 200 and len(json.loads(body)) > 0
+
+    status, body = _get(f"{base_url}/nothing")
+    assert status == 404 and json.loads(body) == {"error": "Unknown query /nothing"}
+
+    status, body = _get(f"{base_url}/utilisation?start=2025-01-01&end=2025-01-02&freq=often")
+    assert status == 400 and "freq" in json.loads(body)["error"]
+
+
+def test_failing_query_is_a_server_error(base_url, monkeypatch):
+    def fail(*args, **kwargs):
+        raise KeyError("start")
+    monkeypatch.setattr(server, "make_sacct_timeseries_fast", fail)
+
+    # a KeyError while computing is not an unknown path
+    status, body = _get(f"{base_url}/utilisation?start=2025-01-01&end=2025-01-02")
+    assert status == 500 and json.loads(body) == {"error": "KeyError: 'start'"}
+
+    monkeypatch.setattr(JobStore, "refresh", lambda self: 1 / 0)
+    status, body = _get(f"{base_url}/refresh", method="POST")
+    assert status == 500 and json.loads(body)["error"].startswith("ZeroDivisionError")
+
+
+def test_queries_are_answered_during_a_reload(tmp_path, monkeypatch):
+    directory = generate_workload(tmp_path / "workload", 1000, months=1)
+    store = JobStore(directory, directory)
+    loading, release = threading.Event(), threading.Event()
+    load = server.get_sacct_data
+
+    def slow_load(*args, **kwargs):
+        loading.set()
+        release.wait(10)
+        return load(*args, **kwargs)
+    monkeypatch.setattr(server, "get_sacct_data", slow_load)
+
+    log = next(directory.glob("JobList_*.txt"))
+    log.write_text(log.read_text())
+    refresh = threading.Thread(target=store.refresh)
+    refresh.start()
+    try:
+        assert loading.wait(10)
+        # the old state is still served while the new one is loading
+        assert store.status()["version"] == 1
+        assert store.snapshot()[0] == 1
+    finally:
+        release.set()
+        refresh.join()
+    assert store.status()["version"] == 2
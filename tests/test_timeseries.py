@@ -0,0 +1,125 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.timeseries import make_sacct_timeseries, make_sacct_timeseries_fast, make_sacct_timeseries_grouped
+
+RESOURCES = ["cpu", "mem_gb", "a100", "indeterminate_gpu"]
+START, END = pd.Timestamp("2025-01-01"), pd.Timestamp("2025-01-03")
+
+
+def _jobs(n=300, seed=0):
+    """Random jobs on and between hourly snapshots, with running, unstarted and partitionless jobs."""
+    rng = np.random.default_rng(seed)
+    hours = pd.to_timedelta(rng.integers(-12, 60, n), unit="h")
+    # a third of the times fall exactly on a snapshot, the rest between snapshots
+    offsets = pd.to_timedelta(np.where(rng.random(n) < 1 / 3, 0, rng.integers(1, 3600, n)), unit="s")
+    start = START + hours + offsets
+    end = start + pd.to_timedelta(rng.integers(0, 20, n), unit="h")
+    end = end.where(rng.random(n) > 0.1)           # running jobs
+    start = start.where(rng.random(n) > 0.05)      # jobs that never started
+    return pd.DataFrame({
+        "partition": rng.choice(np.array(["cpu", "gpu", "himem", None], dtype=object), n, p=[.4, .3, .2, .1]),
+        "start": start,
+        "end": end,
+        "cpu": rng.integers(1, 128, n),
+        "mem_gb": np.round(rng.random(n) * 500, 3),
+        "a100": rng.integers(0, 4, n),
+        # fractional per-node GPU shares, as left by GPU attribution
+        "indeterminate_gpu": rng.integers(0, 5, n) / rng.integers(1, 4, n),
+    })
+
+
+def _exact_sums(jobs, partition, resource, grid):
+    """Correctly rounded sum of the jobs active (start <= t <= end) at each snapshot."""
+    jobs = jobs[jobs["partition"].eq(partition) & jobs["start"].notna()]
+    end = jobs["end"].fillna(pd.Timestamp("2100-01-01"))
+    return np.array([math.fsum(jobs.loc[(jobs["start"] <= t) & (end >= t), resource]) for t in grid])
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_fast_timeseries_matches_reference(workers):
+    jobs = _jobs()
+    reference = make_sacct_timeseries(jobs, RESOURCES, START, END, "h")
+    fast = make_sacct_timeseries_fast(jobs, RESOURCES, START, END, "h", workers=workers)
+
+    assert list(fast.columns) == list(reference.columns)
+    assert list(fast["partition"]) == list(reference["partition"])  # order and the None label
+    assert fast["snapshot time"].equals(reference["snapshot time"])
+    for resource in ["cpu", "a100"]:
+        assert fast[resource].dtype == np.int64
+        assert fast[resource].equals(reference[resource].astype(np.int64))
+    for resource in ["mem_gb", "indeterminate_gpu"]:
+        # float sums are exact and rounded once; the reference adds in order
+        np.testing.assert_allclose(fast[resource], reference[resource], rtol=1e-12, atol=1e-9)
+
+
+def test_float_sums_are_correctly_rounded():
+    jobs = _jobs(seed=1)
+    fast = make_sacct_timeseries_fast(jobs, RESOURCES, START, END, "h")
+    grid = pd.date_range(START, END, freq="h", inclusive="left")
+    for partition in ["cpu", "gpu"]:
+        rows = fast[fast["partition"] == partition]
+        for resource in ["mem_gb", "indeterminate_gpu"]:
+            expected = _exact_sums(jobs, partition, resource, grid)
+            assert np.array_equal(rows[resource].to_numpy(), expected)
+
+
+def test_snapshot_boundaries_are_inclusive():
+    t0, t1 = START + pd.Timedelta(hours=2), START + pd.Timedelta(hours=5)
+    jobs = pd.DataFrame({
+        "partition": ["p", "p", "p", "p"],
+        "start": [t0, t1 + pd.Timedelta(seconds=1), t0 - pd.Timedelta(hours=1), t1],
+        "end": [t1, t1 + pd.Timedelta(hours=1), t0 - pd.Timedelta(seconds=1), t1],
+        "cpu": [1, 10, 100, 1000],
+        "mem_gb": [0.1, 0.2, 0.4, 0.8],
+    })
+    fast = make_sacct_timeseries_fast(jobs, ["cpu", "mem_gb"], START, END, "h").set_index("snapshot time")
+    reference = make_sacct_timeseries(jobs, ["cpu", "mem_gb"], START, END, "h").set_index("snapshot time")
+
+    # a job starting or ending exactly on a snapshot counts there, as does a zero-length one
+    assert fast.loc[t0, "cpu"] == 1
+    assert fast.loc[t1, "cpu"] == 1001
+    assert fast.loc[t1 + pd.Timedelta(hours=1), "cpu"] == 10
+    assert fast.loc[t0 - pd.Timedelta(hours=1), "cpu"] == 100
+    assert fast.loc[t0 - pd.Timedelta(hours=2), "cpu"] == 0
+    assert fast["cpu"].equals(reference["cpu"].astype(np.int64))
+    assert fast["mem_gb"].equals(reference["mem_gb"])
+
+
+def test_float_totals_return_to_zero():
+    jobs = _jobs(seed=2)
+    jobs["end"] = jobs["end"].fillna(START)  # every job has ended by the last snapshots
+    late = pd.Timestamp("2025-01-05")
+    fast = make_sacct_timeseries_fast(jobs, RESOURCES, late, late + pd.Timedelta(hours=3), "h")
+    assert (fast[RESOURCES] == 0).all().all()
+
+
+def test_grouped_timeseries_sums_to_partition_totals():
+    jobs = _jobs(seed=3)
+    jobs = jobs[jobs["partition"].notna()]
+    grouped = make_sacct_timeseries_grouped(jobs, RESOURCES, START, END, "h", ["partition"])
+    fast = make_sacct_timeseries_fast(jobs, RESOURCES, START, END, "h")
+
+    wide = (grouped.pivot_table(index=["snapshot time", "partition"], columns="resource",
+                                values="value", aggfunc="sum", observed=False)
+                   .reindex(columns=RESOURCES).fillna(0))
+    expected = fast.set_index(["snapshot time", "partition"])[RESOURCES]
+    expected = expected[(expected != 0).any(axis=1)]
+    assert len(wide) == len(expected)
+    pd.testing.assert_frame_equal(wide.loc[expected.index], expected.astype(float),
+                                  check_names=False, check_column_type=False)
+    assert (grouped["value"] != 0).all()
+
+
+def test_grouped_values_keep_integer_counts():
+    jobs = _jobs(seed=4)
+    counts = make_sacct_timeseries_grouped(jobs, ["cpu", "a100"], START, END, "h", ["partition"])
+    assert counts["value"].dtype == np.int64
+
+    mixed = make_sacct_timeseries_grouped(jobs, RESOURCES, START, END, "h", [])
+    assert mixed["value"].dtype == np.float64
+    counts = mixed.loc[mixed["resource"].isin(["cpu", "a100"]), "value"]
+    assert (counts == counts.round()).all()
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from src.utils import decode_nodelists, encode_nodelists
+
+
+def test_encode_nodelists_round_trip():
+    nodelists = pd.Series(["gpu[01-03]", "cpu07", "gpu[02,04]", "cpu07"])
+
+    offsets, node_ids, node_names = encode_nodelists(nodelists)
+
+    assert decode_nodelists(offsets, node_ids, node_names) == [
+        ["gpu01", "gpu02", "gpu03"], ["cpu07"], ["gpu02", "gpu04"], ["cpu07"],
+    ]
+    assert len(node_names) == 5
+
+
+def test_missing_nodelists_are_encoded_alike():
+    for nodelists in (pd.Series(["cpu01", None, np.nan], dtype=object),
+                      pd.Series(["cpu01", None, None], dtype="category")):
+        offsets, node_ids, node_names = encode_nodelists(nodelists)
+
+        assert decode_nodelists(offsets, node_ids, node_names) == [["cpu01"], ["nan"], ["nan"]]